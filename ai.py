@@ -1,12 +1,29 @@
 from __future__ import annotations
 
+import asyncio
+import atexit
+import contextlib
+import hashlib
+import inspect
+import logging
 import os
+import queue
 import re
-import traceback
-from typing import Iterable, Optional
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
+import httpx
 from dotenv import load_dotenv
 from google import genai
+from google.genai import types
+
+try:
+    # Optional: RE2 matches in linear time regardless of prompt length.
+    import re2 as _regex_engine
+except ImportError:
+    _regex_engine = re
 
 
 class UnsafeRequestError(Exception):
@@ -17,16 +34,141 @@ class AIServiceError(Exception):
     """Raised when the AI service cannot complete."""
 
 
+class _Abandoned(Exception):
+    """Set on a shared result whose streaming client went away before the end."""
+
+
 # Load environment variables so GOOGLE_API_KEY is available when running locally or in production.
 load_dotenv()
 
 _client: Optional[genai.Client] = None
 _client_key: Optional[str] = None
+# Guards building, swapping and dropping the shared client across server threads.
+_client_lock = threading.Lock()
+# Name of the generation-config keyword accepted by the installed SDK, if any.
+_config_kw: Optional[str] = None
+
+# Upstream calls run on one background event loop so concurrent requests share the
+# async connection pool; the semaphore caps how many reach Gemini at once.
+AI_MAX_CONCURRENCY = int(os.environ.get("AI_MAX_CONCURRENCY", "16"))
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_upstream_slots: Optional[asyncio.Semaphore] = None
+
+# Upper bound on prompts accepted by generate_tale_code_batch.
+MAX_BATCH = 8
+
+# Identical prompts are answered from memory instead of another model round trip.
+AI_CACHE_SIZE = int(os.environ.get("AI_CACHE_SIZE", "512"))
+
+# Both maps are keyed by a 64-bit digest of the normalized prompt. Finished
+# programs are kept in LRU order; misses currently being generated are shared so
+# identical prompts arriving at the same time make one model call.
+_cache: "OrderedDict[int, str]" = OrderedDict()
+_inflight: Dict[int, Future] = {}
+_cache_lock = threading.Lock()
+
+# Keep-alive pool shared by every request so repeat calls skip TCP/TLS setup.
+_HTTP_LIMITS = httpx.Limits(
+    max_keepalive_connections=20, max_connections=100, keepalive_expiry=30.0
+)
+
+
+# Quiet by default; set AI_LOG_LEVEL=DEBUG to trace every request in the server console.
+logger = logging.getLogger("ai")
+logger.setLevel(os.environ.get("AI_LOG_LEVEL", "WARNING").upper())
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("[AI %(levelname)s] %(message)s"))
+    logger.addHandler(_handler)
+    logger.propagate = False
+
+
+def _new_client(api_key: str) -> genai.Client:
+    pool_args = {"limits": _HTTP_LIMITS}
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(client_args=pool_args, async_client_args=pool_args),
+    )
+
+
+def _config_keyword(client: genai.Client) -> Optional[str]:
+    params = inspect.signature(client.aio.models.generate_content).parameters
+    for name in ("generation_config", "config"):
+        if name in params:
+            return name
+    return None
+
+
+def _event_loop() -> asyncio.AbstractEventLoop:
+    # Started on first use so each forked worker process owns its loop thread.
+    global _loop, _upstream_slots
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="ai-event-loop", daemon=True).start()
+            _upstream_slots = asyncio.Semaphore(AI_MAX_CONCURRENCY)
+            _loop = loop
+    return _loop
+
+
+def _forget_event_loop() -> None:
+    # A forked child inherits the loop object but not the thread running it.
+    global _loop, _upstream_slots
+    _loop = None
+    _upstream_slots = None
+
+
+# Windows has no fork, and no register_at_fork either.
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_event_loop)
+
+
+def _close_pooled(client: genai.Client) -> None:
+    client.close()
+    if _loop is not None and _loop.is_running():
+        try:
+            asyncio.run_coroutine_threadsafe(client.aio.aclose(), _loop).result(timeout=5)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Async client close failed: %s", exc)
+
+
+def close_client() -> None:
+    """Release the pooled connections held by the cached genai client."""
+    global _client, _client_key, _config_kw
+    with _client_lock:
+        old = _client
+        _client = None
+        _client_key = None
+        _config_kw = None
+    if old is not None:
+        _close_pooled(old)
+
+
+atexit.register(close_client)
 
 
-def _log_debug(message: str) -> None:
-    # Simple debug logger so errors are visible in the server console.
-    print(f"[AI DEBUG] {message}", flush=True)
+def _ensure_client(api_key: str) -> genai.Client:
+    global _client, _client_key, _config_kw
+    with _client_lock:
+        if _client is not None and _client_key == api_key:
+            logger.debug("Reusing existing genai client")
+            return _client
+        logger.debug("(Re)initializing genai client")
+        old = _client
+        client = _new_client(api_key)
+        _client, _client_key, _config_kw = client, api_key, _config_keyword(client)
+    # Swapped first, so new requests never pick up the client being closed.
+    if old is not None:
+        _close_pooled(old)
+    return client
+
+
+# Build the client at import so the first request does not pay for it. No request
+# is sent here: under a preloading server this runs in the master before forking.
+if os.environ.get("GOOGLE_API_KEY"):
+    _ensure_client(os.environ["GOOGLE_API_KEY"])
+
 
 # Cached system prompt describing TALE language and constraints.
 SYSTEM_PROMPT = """
@@ -73,6 +215,11 @@ Generation rules:
 - Return full programs as needed; keep concise but do not truncate necessary code.
 """.strip()
 
+# The user prompt is spliced between these fixed pieces on every request.
+_PROMPT_PREFIX = SYSTEM_PROMPT + "\n\nUser request:\n"
+_PROMPT_SUFFIX = "\n\nReturn only TALE code with no comments."
+_SYSTEM_LEN = len(SYSTEM_PROMPT)
+
 UNSAFE_PATTERNS = [
     r"\bhack(ing)?\b",
     r"\bexploit\b",
@@ -88,126 +235,361 @@ UNSAFE_PATTERNS = [
     r"for\s+ever",
 ]
 
+# One alternation scans the prompt once instead of once per pattern. The inline
+# (?i) flag keeps the pattern portable between `re` and RE2.
+_UNSAFE_RE = _regex_engine.compile("(?i)" + "|".join(f"(?:{p})" for p in UNSAFE_PATTERNS))
+
 
 def _is_unsafe(text: str) -> bool:
-    lowered = (text or "").lower()
-    unsafe = any(re.search(pattern, lowered) for pattern in UNSAFE_PATTERNS)
+    unsafe = bool(_UNSAFE_RE.search(text or ""))
     if unsafe:
-        _log_debug("Prompt flagged as unsafe")
+        logger.debug("Prompt flagged as unsafe")
     return unsafe
 
 
+# Characters allowed in the language tag after an opening fence, e.g. ```tale.
+_FENCE_TAG_CHARS = frozenset(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-"
+)
+
+
 def _strip_code_fences(text: str) -> str:
     cleaned = text.strip()
-    cleaned = re.sub(r"^```[a-zA-Z0-9_-]*", "", cleaned)
-    cleaned = re.sub(r"```$", "", cleaned)
+    if cleaned.startswith("```"):
+        end = 3
+        while end < len(cleaned) and cleaned[end] in _FENCE_TAG_CHARS:
+            end += 1
+        cleaned = cleaned[end:]
+    if cleaned.endswith("```"):
+        cleaned = cleaned[:-3]
     return cleaned.strip()
 
 
-def _first_text(parts: Iterable) -> str:
-    for part in parts:
-        if hasattr(part, "text") and part.text:
-            return str(part.text)
-    return ""
+# Block reasons that mean "not blocked".
+_OK_REASONS = frozenset({"block_reason_unspecified", ""})
 
 
-def _blocked_reason(response) -> Optional[str]:
-    feedback = getattr(response, "prompt_feedback", None)
-    reason = getattr(feedback, "block_reason", None)
-    if reason and str(reason).lower() not in {"block_reason_unspecified", ""}:
-        _log_debug(f"Prompt blocked: {reason}")
-        return str(reason)
-
-    for cand in getattr(response, "candidates", []) or []:
+def _candidate_block_reason(response) -> Optional[str]:
+    for cand in getattr(response, "candidates", None) or ():
         finish_reason = getattr(cand, "finish_reason", None)
         if finish_reason and "safety" in str(finish_reason).lower():
-            _log_debug(f"Candidate blocked for safety: {finish_reason}")
+            logger.info("Candidate blocked for safety: %s", finish_reason)
             return str(finish_reason)
     return None
 
 
 def _extract_text(response) -> str:
-    reason = _blocked_reason(response)
-    if reason:
+    reason = getattr(getattr(response, "prompt_feedback", None), "block_reason", None)
+    if reason and str(reason).lower() not in _OK_REASONS:
+        logger.info("Prompt blocked: %s", reason)
         raise UnsafeRequestError("Unsafe request")
 
+    # A populated reply is the common case; candidates are only inspected when
+    # it is empty.
     primary = getattr(response, "text", "")
     if primary:
-        _log_debug("Using primary response text")
+        logger.debug("Using primary response text")
         return primary
 
-    _log_debug("Falling back to candidate parts for text")
-    return _first_text(
-        part
-        for cand in getattr(response, "candidates", []) or []
-        for part in getattr(getattr(cand, "content", None), "parts", []) or []
-    )
+    if _candidate_block_reason(response):
+        raise UnsafeRequestError("Unsafe request")
+
+    logger.debug("Falling back to candidate parts for text")
+    for cand in getattr(response, "candidates", None) or ():
+        content = getattr(cand, "content", None)
+        if content is None:
+            continue
+        for part in getattr(content, "parts", None) or ():
+            text = getattr(part, "text", None)
+            if text:
+                return str(text)
+    return ""
+
+
+def _normalize_prompt(prompt: str) -> str:
+    # Collapse whitespace only; case can matter for the text the program prints.
+    return " ".join(prompt.split())
 
 
-def generate_tale_code(user_prompt: str) -> str:
+def _checked_prompt(user_prompt: str) -> str:
     prompt = (user_prompt or "").strip()
     if not prompt:
         raise ValueError("Empty prompt")
 
     if _is_unsafe(prompt):
         raise UnsafeRequestError("Unsafe request")
+    return prompt
+
+
+def generate_tale_code(user_prompt: str, use_cache: bool = True) -> str:
+    prompt = _checked_prompt(user_prompt)
+    if use_cache:
+        return _generate_shared(prompt)
+    return _generate(prompt)
+
+
+def stream_tale_code(user_prompt: str, use_cache: bool = True) -> Iterator[Tuple[str, str]]:
+    """Generate code for one prompt, yielding it while the model writes it.
+
+    Yields ``("delta", text)`` for every received chunk and finishes with one
+    ``("code", code)`` holding the cleaned program. Prompt and configuration
+    errors are raised here, before the iterator is returned. With the cache on,
+    a cached or in-flight prompt yields only the final ``("code", code)``.
+    """
+    prompt = _checked_prompt(user_prompt)
+    if not use_cache:
+        return _stream(_configured_client(), prompt)
+    code = _cached(_prompt_key(_normalize_prompt(prompt)))
+    if code is not None:
+        return _replay(code)
+    return _stream_shared(_configured_client(), prompt)
+
+
+def generate_tale_code_batch(
+    prompts: List[str], use_cache: bool = True
+) -> List[Union[str, Exception]]:
+    """Generate code for several prompts concurrently.
+
+    Each result is either the generated code or the exception raised for that
+    prompt, in the same order as ``prompts``.
+    """
+    if len(prompts) > MAX_BATCH:
+        raise ValueError(f"At most {MAX_BATCH} prompts per batch")
+    if not prompts:
+        return []
+
+    # Gemini reads a list of contents as one conversation, so prompts are fanned
+    # out as separate calls that share the pooled connections instead.
+    with ThreadPoolExecutor(max_workers=len(prompts)) as pool:
+        futures = [pool.submit(generate_tale_code, prompt, use_cache) for prompt in prompts]
+    return [future.exception() or future.result() for future in futures]
+
+
+def _prompt_key(prompt: str) -> int:
+    # Stable across processes, unlike hash(), and cheap to hash again as an int.
+    return int.from_bytes(hashlib.blake2b(prompt.encode(), digest_size=8).digest(), "little")
+
+
+def _cached(key: int) -> Optional[str]:
+    with _cache_lock:
+        code = _cache.get(key)
+        if code is not None:
+            _cache.move_to_end(key)
+        return code
+
+
+def _claim(key: int) -> Tuple[Optional[str], Optional[Future], bool]:
+    """Return ``(code, pending, leader)`` for a prompt key.
+
+    ``code`` is set on a cache hit. Otherwise ``pending`` is the in-flight
+    result, and ``leader`` tells the caller it registered it and must publish.
+    """
+    with _cache_lock:
+        code = _cache.get(key)
+        if code is not None:
+            _cache.move_to_end(key)
+            return code, None, False
+        pending = _inflight.get(key)
+        leader = pending is None
+        if leader:
+            pending = _inflight[key] = Future()
+    return None, pending, leader
+
+
+def _publish(key: int, pending: Future, code: Optional[str], failure: BaseException) -> None:
+    # Failures are handed to waiting callers but never cached.
+    if code is not None:
+        pending.set_result(code)
+    else:
+        pending.set_exception(failure)
+    with _cache_lock:
+        del _inflight[key]
+        if code is not None and AI_CACHE_SIZE > 0:
+            _cache[key] = code
+            if len(_cache) > AI_CACHE_SIZE:
+                _cache.popitem(last=False)
+
 
+def _join(pending: Future, prompt: str) -> str:
+    logger.debug("Joining in-flight generation for identical prompt")
+    try:
+        return pending.result()
+    except _Abandoned:
+        # The leading stream was closed early; generate again rather than fail.
+        return _generate_shared(prompt)
+
+
+def _generate_shared(prompt: str) -> str:
+    # Prompts that differ only in whitespace share an entry; the model still
+    # receives the prompt as written.
+    key = _prompt_key(_normalize_prompt(prompt))
+    code, pending, leader = _claim(key)
+    if code is not None:
+        return code
+    if not leader:
+        return _join(pending, prompt)
+
+    failure: BaseException = _Abandoned()
+    try:
+        code = _generate(prompt)
+    except BaseException as exc:
+        failure = exc
+        raise
+    finally:
+        _publish(key, pending, code, failure)
+    return code
+
+
+def _replay(code: str) -> Iterator[Tuple[str, str]]:
+    # A generator rather than iter(), so callers can close() it like a live stream.
+    yield "code", code
+
+
+def _stream_shared(client: genai.Client, prompt: str) -> Iterator[Tuple[str, str]]:
+    # The key is claimed on the first read, so a stream that is never iterated
+    # does not leave other callers waiting on it.
+    key = _prompt_key(_normalize_prompt(prompt))
+    code, pending, leader = _claim(key)
+    if code is None and not leader:
+        code = _join(pending, prompt)
+    if code is not None:
+        yield "code", code
+        return
+
+    failure: BaseException = _Abandoned()
+    try:
+        for kind, text in _stream(client, prompt):
+            if kind == "code":
+                code = text
+            yield kind, text
+    except Exception as exc:  # noqa: BLE001
+        failure = exc
+        raise
+    finally:
+        _publish(key, pending, code, failure)
+
+
+def _configured_client() -> genai.Client:
     api_key = os.environ.get("GOOGLE_API_KEY")
     if not api_key:
-        _log_debug("GOOGLE_API_KEY missing or empty")
+        logger.warning("GOOGLE_API_KEY missing or empty")
         raise AIServiceError("AI not configured")
+    return _ensure_client(api_key)
 
-    global _client, _client_key
-    if _client is None or _client_key != api_key:
-        _log_debug("(Re)initializing genai client")
-        _client = genai.Client(api_key=api_key)
-        _client_key = api_key
-    else:
-        _log_debug("Reusing existing genai client")
 
-    composed = f"{SYSTEM_PROMPT}\n\nUser request:\n{prompt}\n\nReturn only TALE code with no comments."
-    _log_debug(
-        f"Calling model with prompt_len={len(prompt)} system_len={len(SYSTEM_PROMPT)}"
-    )
+def _request_args(prompt: str) -> dict:
+    composed = _PROMPT_PREFIX + prompt + _PROMPT_SUFFIX
+    logger.debug("Calling model with prompt_len=%d system_len=%d", len(prompt), _SYSTEM_LEN)
 
-    def _call_model() -> object:
-        base_args = {
-            "model": "gemini-2.5-flash",
-            "contents": composed,
-        }
-        gen_cfg = {
+    args = {
+        "model": "gemini-2.5-flash",
+        "contents": composed,
+    }
+    if _config_kw:
+        args[_config_kw] = {
             "temperature": 0.35,
             "response_mime_type": "text/plain",
         }
+    return args
 
-        try:
-            return _client.models.generate_content(
-                **base_args, generation_config=gen_cfg
-            )
-        except TypeError as exc:
-            _log_debug(f"generation_config rejected: {exc}")
-            try:
-                return _client.models.generate_content(**base_args, config=gen_cfg)
-            except TypeError as exc2:
-                _log_debug(f"config rejected; retrying bare call: {exc2}")
-                return _client.models.generate_content(**base_args)
 
-    try:
-        response = _call_model()
-        _log_debug("Model call succeeded")
-    except UnsafeRequestError:
-        raise
-    except Exception as exc:  # noqa: BLE001
-        _log_debug(f"Model call failed: {type(exc).__name__}: {exc}")
-        _log_debug(traceback.format_exc())
-        raise AIServiceError(f"AI request failed: {exc}") from exc
+def _service_error(exc: Exception) -> AIServiceError:
+    # The traceback is only formatted when debug output is switched on.
+    logger.warning(
+        "Model call failed: %s: %s",
+        type(exc).__name__,
+        exc,
+        exc_info=logger.isEnabledFor(logging.DEBUG),
+    )
+    return AIServiceError(f"AI request failed: {exc}")
 
-    text = _extract_text(response)
+
+def _finish(text: str) -> str:
     code = _strip_code_fences(text)
-    _log_debug(f"Received code_len={len(code)}")
+    logger.debug("Received code_len=%d", len(code))
 
     if not code:
-        _log_debug("AI returned empty response")
+        logger.warning("AI returned empty response")
         raise AIServiceError("AI returned empty response")
 
     return code
+
+
+def _generate(prompt: str) -> str:
+    client = _configured_client()
+    args = _request_args(prompt)
+
+    async def _call_model() -> object:
+        async with _upstream_slots:
+            return await client.aio.models.generate_content(**args)
+
+    try:
+        loop = _event_loop()
+        response = asyncio.run_coroutine_threadsafe(_call_model(), loop).result()
+        logger.debug("Model call succeeded")
+    except UnsafeRequestError:
+        raise
+    except Exception as exc:  # noqa: BLE001
+        raise _service_error(exc) from exc
+
+    return _finish(_extract_text(response))
+
+
+def _fenced_block_end(text: str) -> int:
+    """Index just past the fence closing the reply's code block, or -1."""
+    start = len(text) - len(text.lstrip())
+    if not text.startswith("```", start):
+        return -1
+    close = text.find("```", start + 3)
+    return -1 if close == -1 else close + 3
+
+
+_STREAM_END = object()
+
+
+def _stream(client: genai.Client, prompt: str) -> Iterator[Tuple[str, str]]:
+    args = _request_args(prompt)
+    chunks: queue.SimpleQueue = queue.SimpleQueue()
+
+    # The chunks are read on the shared event loop and handed over through a
+    # queue; cancelling the task releases the upstream slot and the connection.
+    async def _pump() -> None:
+        try:
+            async with _upstream_slots:
+                stream = await client.aio.models.generate_content_stream(**args)
+                async with contextlib.aclosing(stream):
+                    async for chunk in stream:
+                        chunks.put(chunk)
+        except Exception as exc:  # noqa: BLE001
+            chunks.put(exc)
+        finally:
+            chunks.put(_STREAM_END)
+
+    task = asyncio.run_coroutine_threadsafe(_pump(), _event_loop())
+    received = ""
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _STREAM_END:
+                break
+            if isinstance(chunk, Exception):
+                raise _service_error(chunk) from chunk
+            delta = _extract_text(chunk)
+            if not delta:
+                continue
+
+            # Anything after the first complete code block is discarded, so
+            # stop reading as soon as its closing fence has arrived.
+            end = _fenced_block_end(received + delta)
+            if end != -1:
+                delta = delta[: end - len(received)]
+            received += delta
+            if delta:
+                yield "delta", delta
+            if end != -1:
+                logger.debug("Code block closed; ending stream early")
+                break
+    finally:
+        task.cancel()
+
+    yield "code", _finish(received)
@@ -1,23 +1,82 @@
-from flask import Flask, jsonify, render_template, request
-from ai import AIServiceError, UnsafeRequestError, generate_tale_code
+import logging
+import math
+import os
+import threading
+
+import orjson
+from flask import Blueprint, Flask, Response, jsonify, render_template, request, stream_with_context
+from flask.json.provider import JSONProvider
+from ai import (
+    MAX_BATCH,
+    AIServiceError,
+    UnsafeRequestError,
+    generate_tale_code,
+    generate_tale_code_batch,
+    stream_tale_code,
+)
+from rate_limit import TokenBucketLimiter
 from tale_engine import analyze_tale_code, run_tale_code
 
+logger = logging.getLogger("ai")
+
+
+class OrjsonProvider(JSONProvider):
+    """Parse request bodies and render jsonify() responses with orjson."""
+
+    def dumps(self, obj, **kwargs) -> str:  # noqa: ANN001
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):  # noqa: ANN001
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):  # noqa: ANN002, ANN003
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+views = Blueprint("tale", __name__)
+
+# The interactive debugger is opt-in: it executes code sent from the browser.
+APP_DEBUG = os.environ.get("APP_DEBUG") == "1"
+
+# AI requests are throttled per client, and only a few may hold a server thread
+# at once, so slow upstream calls cannot starve /run and /analyze.
+AI_RATE_LIMIT = int(os.environ.get("AI_RATE_LIMIT", "10"))
+AI_MAX_INFLIGHT = int(os.environ.get("AI_MAX_INFLIGHT", "8"))
+AI_BUSY_RETRY_AFTER = 2
+_ai_rate = TokenBucketLimiter(AI_RATE_LIMIT)
+_ai_slots = threading.BoundedSemaphore(AI_MAX_INFLIGHT)
+
+
+def _json_payload() -> dict:
+    """Decode a JSON object body; anything else reads as an empty payload."""
+    if not request.is_json:
+        return {}
+    raw = request.get_data(cache=False)
+    if not raw:
+        return {}
+    try:
+        payload = orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
 
 
-@app.route("/")
+@views.route("/")
 def index():
     return render_template("index.html")
 
 
-@app.route("/learn")
+@views.route("/learn")
 def learn():
     return render_template("learn.html")
 
 
-@app.route("/run", methods=["POST"])
+@views.route("/run", methods=["POST"])
 def run_code():
-    payload = request.get_json(force=True, silent=True) or {}
+    payload = _json_payload()
     code = payload.get("code", "")
     inputs = payload.get("inputs", [])
     if not code.strip():
@@ -28,39 +87,150 @@ def run_code():
     return jsonify(result), status
 
 
-@app.route("/analyze", methods=["POST"])
+@views.route("/analyze", methods=["POST"])
 def analyze_code():
-    payload = request.get_json(force=True, silent=True) or {}
+    payload = _json_payload()
     code = payload.get("code", "")
     analysis = analyze_tale_code(code)
     status = 200 if analysis.get("ok") else 400
     return jsonify(analysis), status
 
 
-@app.route("/ai_generate", methods=["POST"])
+def _ai_error(exc: Exception):
+    if isinstance(exc, UnsafeRequestError):
+        logger.info("unsafe: %s", exc)
+        return {"ok": False, "error": "Unsafe request"}, 400
+    if isinstance(exc, AIServiceError):
+        detail = str(exc) or "AI unavailable"
+        logger.warning("AIServiceError: %s", detail)
+        return {"ok": False, "error": detail}, 503
+    logger.error("Unexpected error: %s: %s", type(exc).__name__, exc, exc_info=exc)
+    return {"ok": False, "error": "AI unavailable", "detail": str(exc)}, 503
+
+
+@views.route("/ai_generate", methods=["POST"])
 def ai_generate():
-    payload = request.get_json(force=True, silent=True) or {}
+    payload = _json_payload()
     prompt = (payload.get("prompt") or "").strip()
     if not prompt:
         return jsonify({"ok": False, "error": "Prompt is required."}), 400
 
+    refused = _claim_ai_slot()
+    if refused is not None:
+        return refused
+
+    streaming = None
     try:
-        code = generate_tale_code(prompt)
+        if _wants_event_stream():
+            # The slot is held until the server has finished sending the stream.
+            streaming = _event_stream(
+                stream_tale_code(prompt, use_cache=not payload.get("nocache"))
+            )
+            streaming.call_on_close(_ai_slots.release)
+            return streaming
+        code = generate_tale_code(prompt, use_cache=not payload.get("nocache"))
         return jsonify({"ok": True, "code": code}), 200
-    except UnsafeRequestError as exc:
-        print(f"[AI DEBUG] unsafe: {exc}", flush=True)
-        return jsonify({"ok": False, "error": "Unsafe request"}), 400
-    except AIServiceError as exc:
-        detail = str(exc) or "AI unavailable"
-        print(f"[AI DEBUG] AIServiceError: {detail}", flush=True)
-        return jsonify({"ok": False, "error": detail}), 503
     except Exception as exc:  # noqa: BLE001
-        print(f"[AI DEBUG] Unexpected error: {type(exc).__name__}: {exc}", flush=True)
-        import traceback
+        body, status = _ai_error(exc)
+        return jsonify(body), status
+    finally:
+        if streaming is None:
+            _ai_slots.release()
+
+
+def _claim_ai_slot(cost: int = 1):
+    """Take an in-flight slot and ``cost`` rate tokens, or build the 429 reply.
+
+    Returns None when the caller may go ahead and must release ``_ai_slots``.
+    """
+    if not _ai_slots.acquire(blocking=False):
+        logger.info("AI busy: %d requests in flight", AI_MAX_INFLIGHT)
+        return _too_many("AI is busy, try again shortly.", AI_BUSY_RETRY_AFTER)
+    wait = _ai_rate.acquire(request.remote_addr or "", cost)
+    if wait:
+        _ai_slots.release()
+        logger.info("AI rate limit hit by %s", request.remote_addr)
+        return _too_many("Too many AI requests, slow down.", wait)
+    return None
+
+
+def _too_many(message: str, retry_after: float):
+    response = jsonify({"ok": False, "error": message})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _wants_event_stream() -> bool:
+    # Plain JSON stays the default; clients opt in to streaming explicitly.
+    best = request.accept_mimetypes.best_match(["application/json", "text/event-stream"])
+    return best == "text/event-stream"
+
+
+def _sse(event: dict) -> bytes:
+    return b"data: " + orjson.dumps(event) + b"\n\n"
+
+
+def _event_stream(events):  # noqa: ANN001
+    """Relay generation progress as Server-Sent Events.
+
+    Each chunk is sent as ``{"delta": ...}``; the last event is the usual
+    ``{"ok": true, "code": ...}`` body, or the error body if generation failed.
+    """
+
+    def _relay():
+        try:
+            for kind, text in events:
+                if kind == "delta":
+                    yield _sse({"delta": text})
+                else:
+                    yield _sse({"ok": True, "code": text})
+        except Exception as exc:  # noqa: BLE001
+            yield _sse(_ai_error(exc)[0])
+        finally:
+            # Stops the upstream call too when the browser goes away mid-stream.
+            events.close()
+
+    return Response(
+        stream_with_context(_relay()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@views.route("/ai_generate_batch", methods=["POST"])
+def ai_generate_batch():
+    payload = _json_payload()
+    prompts = payload.get("prompts")
+    if (
+        not isinstance(prompts, list)
+        or not prompts
+        or not all(isinstance(p, str) and p.strip() for p in prompts)
+    ):
+        return jsonify({"ok": False, "error": "Prompts must be a list of non-empty strings."}), 400
+    if len(prompts) > MAX_BATCH:
+        return jsonify({"ok": False, "error": f"At most {MAX_BATCH} prompts per request."}), 400
+
+    refused = _claim_ai_slot(cost=len(prompts))
+    if refused is not None:
+        return refused
+
+    try:
+        outcomes = generate_tale_code_batch(prompts, use_cache=not payload.get("nocache"))
+    finally:
+        _ai_slots.release()
+
+    results = []
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            results.append(_ai_error(outcome)[0])
+        else:
+            results.append({"ok": True, "code": outcome})
+    return jsonify({"ok": True, "results": results}), 200
+
 
-        print(traceback.format_exc(), flush=True)
-        return jsonify({"ok": False, "error": "AI unavailable", "detail": str(exc)}), 503
+app.register_blueprint(views)
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=True, use_reloader=False)
+    app.run(host="0.0.0.0", port=5000, debug=APP_DEBUG, use_reloader=False)
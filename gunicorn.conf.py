@@ -0,0 +1,20 @@
+"""Gunicorn settings for serving the TALE IDE.
+
+Usage: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# AI requests spend most of their time waiting on Gemini, so each worker serves
+# many of them from threads instead of blocking a whole process per request.
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+
+# Import the app once in the master; workers inherit the loaded modules, compiled
+# patterns and system prompt copy-on-write instead of rebuilding them.
+preload_app = True
@@ -0,0 +1,51 @@
+"""In-memory token buckets used to throttle the AI endpoints per client."""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Tuple
+
+
+class TokenBucketLimiter:
+    """Allow ``per_minute`` requests per key, refilled continuously.
+
+    Buckets live in this process only, so every server worker keeps its own.
+    A limit of 0 disables throttling.
+    """
+
+    def __init__(self, per_minute: int, max_keys: int = 10_000) -> None:
+        self.capacity = float(max(per_minute, 0))
+        self.rate = self.capacity / 60.0
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, cost: int = 1) -> float:
+        """Take ``cost`` tokens for ``key``.
+
+        Returns 0 when the request may proceed, otherwise the number of seconds
+        until enough tokens will have been refilled.
+        """
+        if not self.capacity:
+            return 0.0
+        cost = min(float(cost), self.capacity)
+        now = time.monotonic()
+        with self._lock:
+            tokens, stamp = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - stamp) * self.rate)
+            if tokens >= cost:
+                self._store(key, tokens - cost, now)
+                return 0.0
+            self._store(key, tokens, now)
+            return (cost - tokens) / self.rate
+
+    def _store(self, key: str, tokens: float, now: float) -> None:
+        if key not in self._buckets and len(self._buckets) >= self.max_keys:
+            # Buckets that have refilled completely carry no state worth keeping.
+            self._buckets = {
+                k: (t, s)
+                for k, (t, s) in self._buckets.items()
+                if t + (now - s) * self.rate < self.capacity
+            }
+        self._buckets[key] = (tokens, now)
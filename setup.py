@@ -0,0 +1,21 @@
+"""Optional native build of the TALE translator.
+
+    pip install cython setuptools
+    python setup.py build_ext --inplace
+
+This compiles tale_engine.py with Cython into an extension module next to it.
+Python imports the extension ahead of the .py file, so nothing else changes;
+delete the built file to go back to the pure-Python module.
+"""
+
+from Cython.Build import cythonize
+from setuptools import setup
+
+setup(
+    name="tale-engine",
+    ext_modules=cythonize(
+        "tale_engine.py",
+        compiler_directives={"language_level": 3, "binding": True},
+    ),
+    zip_safe=False,
+)
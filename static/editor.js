@@ -465,6 +465,38 @@
     }, 350);
   };
 
+  // Streamed replies report progress as they arrive; the last event carries the result.
+  const readAiReply = async (res) => {
+    const type = res.headers.get("Content-Type") || "";
+    if (!type.startsWith("text/event-stream") || !res.body) return res.json();
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let received = 0;
+    let result = { ok: false, error: "AI generation interrupted" };
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let split = buffer.indexOf("\n\n");
+      while (split !== -1) {
+        const event = buffer.slice(0, split);
+        buffer = buffer.slice(split + 2);
+        split = buffer.indexOf("\n\n");
+        if (!event.startsWith("data: ")) continue;
+        const payload = JSON.parse(event.slice(6));
+        if (typeof payload.delta === "string") {
+          received += payload.delta.length;
+          showSpinner(`Crafting your TALE... (${received} characters)`);
+        } else {
+          result = payload;
+        }
+      }
+    }
+    return result;
+  };
+
   const submitPrompt = async () => {
     if (!promptMode || !editor) return;
     const prompt = editor.getValue().trim();
@@ -482,10 +514,10 @@
     try {
       const res = await fetch("/ai_generate", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
         body: JSON.stringify({ prompt }),
       });
-      const data = await res.json();
+      const data = await readAiReply(res);
       if (res.ok && data.ok && data.code) {
         exitPromptMode(data.code);
         renderOutput("AI generation complete.");
@@ -6,21 +6,141 @@ The goal is to let beginners learn Python concepts using readable English-style
 from __future__ import annotations
 
 import ast
-import io
 import json
+import keyword
 import csv
+import functools
+import hashlib
 import math
 import os
 import random
 import re
-import shlex
 import sys
 import textwrap
+import threading
+from collections import OrderedDict
 from contextlib import redirect_stdout
 from datetime import datetime
+from types import CodeType
 from typing import Dict, List, Optional, Tuple
 
 
+# Patterns used while translating, compiled once at import.
+_RE_INT = re.compile(r"[+-]?\d+")
+_RE_FLOAT = re.compile(r"[+-]?(\d+\.\d*|\d*\.\d+)")
+_RE_TWO = re.compile(r"(\S+)\s+(.+)")
+_RE_REPLACE = re.compile(r'replace\s+(.+?)\s+"([^"]*)"\s+"([^"]*)"')
+_RE_STR_OP = re.compile(r"(split|join|find|count|starts|ends)\s+(.+?)\s+(.+)$")
+_RE_COUNT_OP = re.compile(r"count\s*[><=]")
+# Keywords (any case) and conversion calls (lowercase only) rewritten in one pass;
+# the group that matched names the replacement in _KEYWORD_REWRITES.
+_RE_KEYWORDS = re.compile(
+    r"(?i:\b(?:(?P<ne>is not same as)|(?P<eq>is same as)|(?P<true>true)|(?P<false>false)"
+    r"|(?P<none>nothing|none))\b)"
+    r"|\b(?:(?P<int>number)|(?P<str>text)|(?P<float>decimal))\("
+)
+_RE_LINE_NO = re.compile(r"Line (\d+):")
+# A quoted string, a lone quote that was never closed, or a word starting elsewhere.
+_RE_WORD = re.compile(r"\"[^\"]*\"|'[^']*'|[\"']|[^\s\"']\S*")
+_RE_QUOTE_OR_BRACKET = re.compile(r"[\"'()\[\]{}]")
+
+# Entries kept by each interpreter's expression cache before it starts over.
+_XFORM_CACHE_LIMIT = 4096
+
+# Translations shared by all interpreters, most recently used last. Users tend to
+# press Run repeatedly on the same program with different inputs.
+_TRANSLATE_CACHE_SIZE = 64
+# Entries are [python_source, code_object_or_None]; the code object is compiled on
+# first use.
+_translate_cache: "OrderedDict[bytes, list]" = OrderedDict()
+_translate_lock = threading.Lock()
+
+# Statement lines known to translate cleanly, shared by validate_only calls; the
+# editor re-checks the whole program after every edit.
+_VALID_LINES_LIMIT = 8192
+_valid_lines: set = set()
+
+# Indentation strings for the nesting depths real programs reach.
+_PADS = tuple("    " * depth for depth in range(32))
+
+# String methods written as a leading word, e.g. "upper name" -> (name).upper().
+_UNARY_STR_SUFFIX = {
+    "upper": ".upper()",
+    "lower": ".lower()",
+    "title": ".title()",
+    "strip": ".strip()",
+    "isalpha": ".isalpha()",
+    "isdigit": ".isdigit()",
+    "isalnum": ".isalnum()",
+}
+
+# String methods taking one argument, e.g. "split line ," -> (line).split(",").
+_STR_METHODS = {
+    "split": "split",
+    "join": "join",
+    "find": "find",
+    "count": "count",
+    "starts": "startswith",
+    "ends": "endswith",
+}
+
+# Characters that rule out the space-separated call shorthand, e.g. "add x + 1".
+_SHORTHAND_FORBIDDEN = frozenset("+-*/%<>=:()[]{}.,")
+
+# Constants a bare word may spell, matched in any case.
+_BARE_CONSTANTS = {"true": "True", "false": "False", "nothing": "None", "none": "None"}
+
+_KEYWORD_REWRITES = {
+    "ne": " != ",
+    "eq": " == ",
+    "true": "True",
+    "false": "False",
+    "none": "None",
+    "int": "int(",
+    "str": "str(",
+    "float": "float(",
+}
+
+# One-argument builtins written as a leading word, e.g. "len nums" -> len(nums).
+_WRAPPED_BUILTINS = frozenset({"enumerate", "next", "len", "sum", "min", "max", "sorted", "any", "all"})
+
+# Characters that may start a bare dict key, e.g. the "n" in {name: "Alex"}.
+_KEY_START = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_")
+
+# Statements that also match when glued to what follows, e.g. "return(x)".
+_PREFIX_KEYWORDS = ("return", "yield", "raise")
+
+
+def _split_plain(text: str, delimiter: str) -> List[str]:
+    # Text without quotes or brackets splits at every delimiter; like the scanners,
+    # drop a trailing empty segment.
+    parts = text.split(delimiter)
+    if not parts[-1]:
+        parts.pop()
+    return parts
+
+
+def _keyword_rewrite(match: "re.Match[str]") -> str:
+    return _KEYWORD_REWRITES[match.lastgroup]
+
+
+def _is_name(text: str) -> bool:
+    # A name TALE code may bind or call: a Python identifier that is not a keyword.
+    return text.isidentifier() and not keyword.iskeyword(text)
+
+
+def _split_words(text: str) -> List[str]:
+    # Whitespace-separated words where a leading quote runs to its partner and keeps
+    # both quotes, as shlex.split(posix=False) does; an unclosed quote falls back to
+    # a plain split.
+    if '"' not in text and "'" not in text:
+        return text.split()
+    words = _RE_WORD.findall(text)
+    if '"' in words or "'" in words:
+        return text.split()
+    return words
+
+
 class TaleSyntaxError(Exception):
     """Raised when TALE code cannot be translated."""
 
@@ -30,10 +150,15 @@ class InputExhausted(Exception):
 
 
 class TaleInterpreter:
+    # One interpreter is created per request, so skip the per-instance __dict__.
+    __slots__ = ("code", "inputs", "_input_index", "_xform_cache", "_entry")
+
     def __init__(self, code: str, inputs: Optional[List[str]] = None) -> None:
         self.code = code
         self.inputs = inputs or []
         self._input_index = 0
+        self._xform_cache: Dict[str, str] = {}
+        self._entry: Optional[list] = None
 
     # Input is pulled from the supplied list for deterministic execution.
     def input_provider(self) -> str:
@@ -43,9 +168,9 @@ class TaleInterpreter:
             value = str(raw)
 
             # Auto-coerce numeric-looking inputs so math works naturally.
-            if re.fullmatch(r"[+-]?\d+", value):
+            if _RE_INT.fullmatch(value):
                 return int(value)
-            if re.fullmatch(r"[+-]?(\d+\.\d*|\d*\.\d+)", value):
+            if _RE_FLOAT.fullmatch(value):
                 try:
                     return float(value)
                 except ValueError:
@@ -57,12 +182,67 @@ class TaleInterpreter:
         )
 
     def to_python(self) -> str:
-        py_lines: List[str] = []
+        return self._cached()[0]
+
+    def compiled(self) -> CodeType:
+        """Return the translated program compiled for exec, shared with earlier runs."""
+        entry = self._cached()
+        if entry[1] is None:
+            entry[1] = compile(entry[0], "<string>", "exec")
+        return entry[1]
+
+    def _cached(self) -> list:
+        if self._entry is not None:
+            return self._entry
+        key = hashlib.blake2b(self.code.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        with _translate_lock:
+            entry = _translate_cache.get(key)
+            if entry is not None:
+                _translate_cache.move_to_end(key)
+        if entry is None:
+            entry = [self._translate(), None]
+            with _translate_lock:
+                _translate_cache[key] = entry
+                if len(_translate_cache) > _TRANSLATE_CACHE_SIZE:
+                    _translate_cache.popitem(last=False)
+        self._entry = entry
+        return entry
+
+    def validate_only(self) -> None:
+        """Raise the TaleSyntaxError to_python would, without building the program.
+
+        Statements translate the same wherever they appear, so lines that passed
+        before are skipped and only new ones are translated.
+        """
+        in_note = False
+        note_delim = '"""'
+        for line_no, raw_line in enumerate(self.code.splitlines(), start=1):
+            stripped = raw_line.strip()
+            if in_note:
+                if stripped.endswith(note_delim):
+                    in_note = False
+                continue
+            if not stripped or stripped[0] == "#" or stripped in _valid_lines:
+                continue
+            if stripped[:4].lower() == "note" and stripped.startswith(" " + note_delim, 4):
+                if not stripped.endswith(note_delim):
+                    in_note = True
+                continue
+            self._translate([raw_line], line_no)
+            if len(_valid_lines) >= _VALID_LINES_LIMIT:
+                _valid_lines.clear()
+            _valid_lines.add(stripped)
+
+    def _translate(self, lines: Optional[List[str]] = None, first_line_no: int = 1) -> str:
+        # (indent, statement) pairs; indentation is applied once in the final join.
+        py_lines: List[Tuple[int, str]] = []
         indent = 0
         in_note = False
         note_delim = '"""'
+        if lines is None:
+            lines = self.code.splitlines()
 
-        for line_no, raw_line in enumerate(self.code.splitlines(), start=1):
+        for line_no, raw_line in enumerate(lines, start=first_line_no):
             original = raw_line.rstrip("\n")
             stripped = original.strip()
 
@@ -71,52 +251,54 @@ class TaleInterpreter:
                     in_note = False
                 continue
 
-            if not stripped or stripped.startswith("#"):
+            if not stripped or stripped[0] == "#":
                 continue
 
-            lowered = stripped.lower()
+            # Only the first word is case-insensitive; the rest of the line is kept as typed.
+            space = stripped.find(" ")
+            head = (stripped if space == -1 else stripped[:space]).lower()
 
-            if lowered.startswith("note " + note_delim):
+            if head == "note" and stripped.startswith(note_delim, 5):
                 if not stripped.endswith(note_delim):
                     in_note = True
                 continue
 
-            if lowered == "end":
+            if space == -1 and head == "end":
                 indent = max(indent - 1, 0)
                 continue
 
-            if lowered.startswith("elif "):
+            if space != -1 and head == "elif":
                 indent = max(indent - 1, 0)
                 condition = stripped[5:].strip()
                 condition = self._transform_expr(condition)
                 self._validate_expr(condition, original)
-                py_lines.append(self._pad(indent) + f"elif {condition}:")
+                py_lines.append((indent, f"elif {condition}:"))
                 indent += 1
                 continue
 
-            if lowered == "else":
+            if space == -1 and head == "else":
                 indent = max(indent - 1, 0)
-                py_lines.append(self._pad(indent) + "else:")
+                py_lines.append((indent, "else:"))
                 indent += 1
                 continue
 
-            if lowered.startswith("catch "):
+            if space != -1 and head == "catch":
                 indent = max(indent - 1, 0)
                 err_name = stripped[6:].strip() or "error"
                 self._validate_name(err_name, original)
-                py_lines.append(self._pad(indent) + f"except Exception as {err_name}:")
+                py_lines.append((indent, f"except Exception as {err_name}:"))
                 indent += 1
                 continue
 
-            if lowered == "finally":
+            if space == -1 and head == "finally":
                 indent = max(indent - 1, 0)
-                py_lines.append(self._pad(indent) + "finally:")
+                py_lines.append((indent, "finally:"))
                 indent += 1
                 continue
 
             try:
-                python_line, opens_block = self._translate_line(original)
-                py_lines.append(self._pad(indent) + python_line)
+                python_line, opens_block = self._translate_line(stripped, head)
+                py_lines.append((indent, python_line))
                 if opens_block:
                     indent += 1
             except TaleSyntaxError as exc:
@@ -124,356 +306,432 @@ class TaleInterpreter:
             except Exception as exc:  # noqa: BLE001
                 raise TaleSyntaxError(f"Line {line_no}: {exc}") from exc
 
-        return "\n".join(py_lines)
+        pad = self._pad
+        return "\n".join([pad(depth) + statement for depth, statement in py_lines])
 
     def _pad(self, indent: int) -> str:
-        return "    " * max(indent, 0)
-
-    def _translate_line(self, line: str) -> Tuple[str, bool]:
-        stripped = line.strip()
-        lowered = stripped.lower()
-
-        # Control blocks
-        if lowered.startswith("if "):
-            condition = self._transform_expr(stripped[3:])
-            self._validate_expr(condition, line)
-            return f"if {condition}:", True
-
-        if lowered.startswith("while "):
-            condition = self._transform_expr(stripped[6:])
-            self._validate_expr(condition, line)
-            return f"while {condition}:", True
-
-        if lowered == "try":
+        if indent < len(_PADS):
+            return _PADS[max(indent, 0)]
+        return "    " * indent
+
+    def _translate_line(self, stripped: str, head: str) -> Tuple[str, bool]:
+        # Statements are picked by their lowercased first word (``head``). A handler
+        # returns None when the rest of the line does not fit its form, leaving it to
+        # the generic forms below.
+        bare = " " not in stripped
+        if not bare:
+            handler = self._LINE_HANDLERS.get(head)
+            if handler is not None:
+                translated = handler(self, stripped, head)
+                if translated is not None:
+                    return translated
+        elif head == "try":
             return "try:", True
 
-        if lowered.startswith("function "):
-            header = stripped[9:].strip()
-            name, params = self._parse_fn_header(header, line)
-            return f"def {name}({params}):", True
+        for prefix in _PREFIX_KEYWORDS:
+            if head.startswith(prefix):
+                return self._LINE_HANDLERS[prefix](self, stripped, head)
 
-        if lowered.startswith("generator "):
-            header = stripped[10:].strip()
-            name, params = self._parse_fn_header(header, line)
-            return f"def {name}({params}):", True
+        if bare and head in {"break", "continue", "pass"}:
+            return head, False
+
+        # Assignment using "is"
+        idx = stripped.find(" is ")
+        if idx != -1:
+            var = stripped[:idx].strip()
+            expr_part = stripped[idx + 4:]
+            self._validate_name(var, stripped)
+            expr = self._transform_expr(expr_part.strip())
+            self._validate_expr(expr, stripped)
+            return f"{var} = {expr}", False
 
-        if lowered.startswith("class "):
-            class_def = stripped[6:].strip()
-            return f"class {class_def}:", True
+        # Fall back: expression-only line
+        expr = self._transform_expr(stripped)
+        self._validate_expr(expr, stripped)
+        return expr, False
 
-        if lowered.startswith("with file ") and " as " in lowered:
-            before_as, alias = stripped[9:].split(" as ", 1)
+    # Control blocks
+    def _tl_if(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        condition = self._transform_expr(stripped[3:])
+        self._validate_expr(condition, stripped)
+        return f"if {condition}:", True
+
+    def _tl_while(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        condition = self._transform_expr(stripped[6:])
+        self._validate_expr(condition, stripped)
+        return f"while {condition}:", True
+
+    def _tl_function(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        header = stripped[9:].strip()
+        name, params = self._parse_fn_header(header, stripped)
+        return f"def {name}({params}):", True
+
+    def _tl_generator(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        header = stripped[10:].strip()
+        name, params = self._parse_fn_header(header, stripped)
+        return f"def {name}({params}):", True
+
+    def _tl_class(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        class_def = stripped[6:].strip()
+        return f"class {class_def}:", True
+
+    def _tl_with(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        if stripped[5:10].lower() == "file ":
+            idx = stripped.find(" as ", 9)
+            if idx == -1:
+                return None
+            before_as, alias = stripped[9:idx], stripped[idx + 4:]
             file_expr = self._transform_expr(before_as.strip())
             alias_name = alias.strip()
-            self._validate_name(alias_name, line)
+            self._validate_name(alias_name, stripped)
             py = f"with _open_file({file_expr}, 'r') as {alias_name}:"
             return py, True
 
-        if lowered.startswith("with ") and " as " in lowered:
-            before_as, alias = stripped[5:].split(" as ", 1)
-            ctx_expr = self._transform_expr(before_as.strip())
-            alias_name = alias.strip()
-            self._validate_name(alias_name, line)
-            return f"with {ctx_expr} as {alias_name}:", True
-
-        if lowered.startswith("for each ") and " in " in lowered:
-            rest = stripped[9:]
-            var_part, expr_part = rest.split(" in ", 1)
-            var_name = var_part.strip()
-            expr = self._transform_expr(expr_part.strip())
-            self._validate_name(var_name, line)
-            return f"for {var_name} in {expr}:", True
-
-        if lowered.startswith("repeat "):
-            body = stripped[7:].strip()
-            if " as " in body:
-                count_expr, var_name = body.split(" as ", 1)
-                var = var_name.strip()
-                self._validate_name(var, line)
-                count = self._transform_expr(count_expr.strip())
-                self._validate_expr(count, line)
-                return f"for {var} in range({count}):", True
-            count = self._transform_expr(body)
-            self._validate_expr(count, line)
-            return f"for _ in range({count}):", True
-
-        # Simple statements
-        if lowered.startswith("say formatted "):
+        idx = stripped.find(" as ", 5)
+        if idx == -1:
+            return None
+        before_as, alias = stripped[5:idx], stripped[idx + 4:]
+        ctx_expr = self._transform_expr(before_as.strip())
+        alias_name = alias.strip()
+        self._validate_name(alias_name, stripped)
+        return f"with {ctx_expr} as {alias_name}:", True
+
+    def _tl_for(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        if stripped[4:9].lower() != "each ":
+            return None
+        idx = stripped.find(" in ", 9)
+        if idx == -1:
+            return None
+        var_part, expr_part = stripped[9:idx], stripped[idx + 4:]
+        var_name = var_part.strip()
+        expr = self._transform_expr(expr_part.strip())
+        self._validate_name(var_name, stripped)
+        return f"for {var_name} in {expr}:", True
+
+    def _tl_repeat(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        body = stripped[7:].strip()
+        count_expr, sep, var_name = body.partition(" as ")
+        if sep:
+            var = var_name.strip()
+            self._validate_name(var, stripped)
+            count = self._transform_expr(count_expr.strip())
+            self._validate_expr(count, stripped)
+            return f"for {var} in range({count}):", True
+        count = self._transform_expr(body)
+        self._validate_expr(count, stripped)
+        return f"for _ in range({count}):", True
+
+    # Simple statements
+    def _tl_say(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        if stripped[4:14].lower() == "formatted ":
             fmt = stripped[len("say formatted "):].strip()
             py_expr = f"f{fmt}" if not fmt.startswith("f") else fmt
-            self._validate_expr(py_expr, line)
+            self._validate_expr(py_expr, stripped)
             return f"print({py_expr})", False
 
-        if lowered.startswith("say "):
-            payload = stripped[4:].strip()
-            if payload.startswith('"""'):
-                # multi-line literal stays as-is
-                py_expr = payload
-                self._validate_expr(py_expr, line)
-                return f"print({py_expr})", False
-
-            # Validate each argument individually so mixing text/numbers works naturally.
-            split_args = self._split_args(payload)
-
-            # If commas are absent, also support string + number + string style concatenations.
-            if len(split_args) == 1:
-                concat_parts = self._split_concat_args(payload)
-                if len(concat_parts) > 1 and any(self._looks_like_string(p) for p in concat_parts):
-                    split_args = concat_parts
-
-            parts: List[str] = []
-            for part in split_args:
-                expr = self._transform_expr(part.strip())
-                self._validate_expr(expr, line)
-                parts.append(expr)
-
-            py_expr = ", ".join(parts)
+        payload = stripped[4:].strip()
+        if payload.startswith('"""'):
+            # multi-line literal stays as-is
+            py_expr = payload
+            self._validate_expr(py_expr, stripped)
             return f"print({py_expr})", False
 
-        if lowered.startswith("ask "):
-            body = stripped[4:].strip()
-            if not body:
-                raise TaleSyntaxError(f"I could not understand: {line.strip()}")
-
-            # ask "Prompt" as var  -> print prompt then read input into var (and result)
-            if " as " in body:
-                prompt_part, var_part = body.split(" as ", 1)
-                prompt_expr = self._transform_expr(prompt_part.strip())
-                self._validate_expr(prompt_expr, line)
-                var_name = var_part.strip()
-                self._validate_name(var_name, line)
-                return (
-                    f"print({prompt_expr}, end=''); {var_name} = input_provider(); result = {var_name}",
-                    False,
-                )
-
-            # ask name -> read input into name (and result)
-            if re.match(r"^[A-Za-z_][\w]*$", body):
-                self._validate_name(body, line)
-                return f"{body} = input_provider(); result = {body}", False
-
-            # ask "Prompt" -> print prompt then store input in result
-            prompt_expr = self._transform_expr(body)
-            self._validate_expr(prompt_expr, line)
-            return f"print({prompt_expr}, end=''); result = input_provider()", False
-
-        if lowered.startswith("return"):
-            tail = stripped[6:].strip()
-            if not tail:
-                return "return", False
-            expr = self._transform_expr(tail)
-            self._validate_expr(expr, line)
-            return f"return {expr}", False
-
-        if lowered.startswith("yield"):
-            tail = stripped[5:].strip()
-            expr = self._transform_expr(tail) if tail else "None"
-            self._validate_expr(expr, line)
-            return f"yield {expr}", False
-
-        if lowered.startswith("raise"):
-            tail = stripped[5:].strip()
-            expr = self._transform_expr(tail) if tail else "Exception()"
-            self._validate_expr(expr, line)
-            return f"raise {expr}", False
-
-        if lowered.startswith("import "):
-            return stripped, False
-
-        if lowered.startswith("from "):
-            return stripped, False
-
-        if lowered.startswith("global "):
-            return stripped, False
-
-        # File handling
-        if lowered.startswith("open ") and " as " in lowered:
-            before_as, alias = stripped[5:].split(" as ", 1)
-            file_expr = self._transform_expr(before_as.strip())
-            alias_name = alias.strip()
-            self._validate_name(alias_name, line)
-            return f"{alias_name} = _open_file({file_expr}, 'r')", False
-
-        if lowered.startswith("write "):
-            # write f "text"
-            body = stripped[6:]
-            match = re.match(r"(\S+)\s+(.+)", body)
-            if not match:
-                raise TaleSyntaxError(f"Wrong number of values: {line.strip()}")
-            target, content = match.group(1), match.group(2)
-            expr_target = self._transform_expr(target)
-            expr_content = self._transform_expr(content)
-            return f"{expr_target}.write({expr_content})", False
-
-        if lowered.startswith("append "):
-            body = stripped[7:]
-            match = re.match(r"(\S+)\s+(.+)", body)
-            if not match:
-                raise TaleSyntaxError(f"Wrong number of values: {line.strip()}")
-            target, content = match.group(1), match.group(2)
-            expr_target = self._transform_expr(target)
-            expr_content = self._transform_expr(content)
-            return f"{expr_target}.write({expr_content})", False
-
-        if lowered.startswith("read "):
-            expr = self._transform_expr(stripped[5:].strip())
-            return f"{expr}.read()", False
-
-        if lowered.startswith("close "):
-            expr = self._transform_expr(stripped[6:].strip())
-            return f"{expr}.close()", False
-
-        # Collections helpers
-        if lowered.startswith("add ") and " to " in lowered:
-            item, target = stripped[4:].split(" to ", 1)
-            expr_item = self._transform_expr(item.strip())
-            target_name = target.strip()
-            self._validate_name(target_name, line)
-            # Allow both list-style append and numeric/string addition in a single construct.
-            return f"{target_name} = _add_to({target_name}, {expr_item})", False
-
-        if lowered.startswith("extend ") and " with " in lowered:
-            target, rest = stripped[7:].split(" with ", 1)
-            target_name = target.strip()
-            expr = self._transform_expr(rest.strip())
-            self._validate_name(target_name, line)
-            return f"{target_name}.extend({expr})", False
-
-        if lowered.startswith("insert ") and " into " in lowered and " at " in lowered:
-            value_part, rest = stripped[7:].split(" into ", 1)
-            list_part, idx_part = rest.split(" at ", 1)
-            list_name = list_part.strip()
-            idx_expr = self._transform_expr(idx_part.strip())
-            val_expr = self._transform_expr(value_part.strip())
-            self._validate_name(list_name, line)
-            return f"{list_name}.insert({idx_expr}, {val_expr})", False
-
-        if lowered.startswith("remove ") and " from " in lowered:
-            value_part, list_part = stripped[7:].split(" from ", 1)
-            list_name = list_part.strip()
-            val_expr = self._transform_expr(value_part.strip())
-            self._validate_name(list_name, line)
-            return f"{list_name}.remove({val_expr})", False
-
-        if lowered.startswith("clear "):
-            list_name = stripped[6:].strip()
-            return f"{list_name}.clear()", False
-
-        if lowered.startswith("sort "):
-            list_name = stripped[5:].strip()
-            return f"{list_name}.sort()", False
-
-        if lowered.startswith("reverse "):
-            list_name = stripped[8:].strip()
-            return f"{list_name}.reverse()", False
-
-        if lowered.startswith("copy "):
-            target = stripped[5:].strip()
-            expr = self._transform_expr(target)
-            return f"({expr}).copy()", False
-
-        if lowered.startswith("get ") and " from " in lowered:
-            key_part, dict_part = stripped[4:].split(" from ", 1)
+        # Validate each argument individually so mixing text/numbers works naturally.
+        split_args = self._split_args(payload)
+
+        # If commas are absent, also support string + number + string style concatenations.
+        if len(split_args) == 1:
+            concat_parts = self._split_concat_args(payload)
+            if len(concat_parts) > 1 and any(self._looks_like_string(p) for p in concat_parts):
+                split_args = concat_parts
+
+        parts: List[str] = []
+        for part in split_args:
+            expr = self._transform_expr(part.strip())
+            self._validate_expr(expr, stripped)
+            parts.append(expr)
+
+        py_expr = ", ".join(parts)
+        return f"print({py_expr})", False
+
+    def _tl_ask(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        body = stripped[4:].strip()
+        if not body:
+            raise TaleSyntaxError(f"I could not understand: {stripped}")
+
+        # ask "Prompt" as var  -> print prompt then read input into var (and result)
+        prompt_part, sep, var_part = body.partition(" as ")
+        if sep:
+            prompt_expr = self._transform_expr(prompt_part.strip())
+            self._validate_expr(prompt_expr, stripped)
+            var_name = var_part.strip()
+            self._validate_name(var_name, stripped)
+            return (
+                f"print({prompt_expr}, end=''); {var_name} = input_provider(); result = {var_name}",
+                False,
+            )
+
+        # ask name -> read input into name (and result)
+        if _is_name(body):
+            self._validate_name(body, stripped)
+            return f"{body} = input_provider(); result = {body}", False
+
+        # ask "Prompt" -> print prompt then store input in result
+        prompt_expr = self._transform_expr(body)
+        self._validate_expr(prompt_expr, stripped)
+        return f"print({prompt_expr}, end=''); result = input_provider()", False
+
+    def _tl_return(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        tail = stripped[6:].strip()
+        if not tail:
+            return "return", False
+        expr = self._transform_expr(tail)
+        self._validate_expr(expr, stripped)
+        return f"return {expr}", False
+
+    def _tl_yield(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        tail = stripped[5:].strip()
+        expr = self._transform_expr(tail) if tail else "None"
+        self._validate_expr(expr, stripped)
+        return f"yield {expr}", False
+
+    def _tl_raise(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        tail = stripped[5:].strip()
+        expr = self._transform_expr(tail) if tail else "Exception()"
+        self._validate_expr(expr, stripped)
+        return f"raise {expr}", False
+
+    def _tl_passthrough(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        # import / from / global are already Python.
+        return stripped, False
+
+    # File handling
+    def _tl_open(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        idx = stripped.find(" as ", 5)
+        if idx == -1:
+            return None
+        before_as, alias = stripped[5:idx], stripped[idx + 4:]
+        file_expr = self._transform_expr(before_as.strip())
+        alias_name = alias.strip()
+        self._validate_name(alias_name, stripped)
+        return f"{alias_name} = _open_file({file_expr}, 'r')", False
+
+    def _tl_write(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        # write f "text"
+        body = stripped[6:]
+        match = _RE_TWO.match(body)
+        if not match:
+            raise TaleSyntaxError(f"Wrong number of values: {stripped}")
+        target, content = match.group(1), match.group(2)
+        expr_target = self._transform_expr(target)
+        expr_content = self._transform_expr(content)
+        return f"{expr_target}.write({expr_content})", False
+
+    def _tl_append(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        body = stripped[7:]
+        match = _RE_TWO.match(body)
+        if not match:
+            raise TaleSyntaxError(f"Wrong number of values: {stripped}")
+        target, content = match.group(1), match.group(2)
+        expr_target = self._transform_expr(target)
+        expr_content = self._transform_expr(content)
+        return f"{expr_target}.write({expr_content})", False
+
+    def _tl_read(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        expr = self._transform_expr(stripped[5:].strip())
+        return f"{expr}.read()", False
+
+    def _tl_close(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        expr = self._transform_expr(stripped[6:].strip())
+        return f"{expr}.close()", False
+
+    # Collections helpers
+    def _tl_add(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        idx = stripped.find(" to ", 4)
+        if idx == -1:
+            return None
+        item, target = stripped[4:idx], stripped[idx + 4:]
+        expr_item = self._transform_expr(item.strip())
+        target_name = target.strip()
+        self._validate_name(target_name, stripped)
+        # Allow both list-style append and numeric/string addition in a single construct.
+        return f"{target_name} = _add_to({target_name}, {expr_item})", False
+
+    def _tl_extend(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        idx = stripped.find(" with ", 7)
+        if idx == -1:
+            return None
+        target, rest = stripped[7:idx], stripped[idx + 6:]
+        target_name = target.strip()
+        expr = self._transform_expr(rest.strip())
+        self._validate_name(target_name, stripped)
+        return f"{target_name}.extend({expr})", False
+
+    def _tl_insert(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        into = stripped.find(" into ", 7)
+        if into == -1:
+            return None
+        at = stripped.find(" at ", into + 6)
+        if at == -1:
+            return None
+        value_part = stripped[7:into]
+        list_part, idx_part = stripped[into + 6:at], stripped[at + 4:]
+        list_name = list_part.strip()
+        idx_expr = self._transform_expr(idx_part.strip())
+        val_expr = self._transform_expr(value_part.strip())
+        self._validate_name(list_name, stripped)
+        return f"{list_name}.insert({idx_expr}, {val_expr})", False
+
+    def _tl_remove(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        idx = stripped.find(" from ", 7)
+        if idx == -1:
+            return None
+        value_part, list_part = stripped[7:idx], stripped[idx + 6:]
+        list_name = list_part.strip()
+        val_expr = self._transform_expr(value_part.strip())
+        self._validate_name(list_name, stripped)
+        return f"{list_name}.remove({val_expr})", False
+
+    def _tl_clear(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        list_name = stripped[6:].strip()
+        return f"{list_name}.clear()", False
+
+    def _tl_sort(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        list_name = stripped[5:].strip()
+        return f"{list_name}.sort()", False
+
+    def _tl_reverse(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        list_name = stripped[8:].strip()
+        return f"{list_name}.reverse()", False
+
+    def _tl_copy(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        target = stripped[5:].strip()
+        expr = self._transform_expr(target)
+        return f"({expr}).copy()", False
+
+    def _tl_get(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        idx = stripped.find(" from ", 4)
+        if idx != -1:
+            key_part, dict_part = stripped[4:idx], stripped[idx + 6:]
             key_expr = self._transform_expr(key_part.strip())
             dict_expr = self._transform_expr(dict_part.strip())
             return f"{dict_expr}.get({key_expr})", False
 
-        if lowered.startswith("get "):
-            body = stripped[4:]
-            if " " in body:
-                dict_name, key = body.split(" ", 1)
-                dict_expr = self._transform_expr(dict_name.strip())
-                raw_key = key.strip()
-                if re.match(r"^[A-Za-z_][\w]*$", raw_key):
-                    key_expr = repr(raw_key)
-                else:
-                    key_expr = self._transform_expr(raw_key)
-                return f"{dict_expr}.get({key_expr})", False
-
-        if lowered.startswith("set ") and " to " in lowered:
-            body = stripped[4:]
-            before_to, value_part = body.split(" to ", 1)
-            if " " in before_to:
-                dict_name, key_part = before_to.split(" ", 1)
-                dict_expr = self._transform_expr(dict_name.strip())
-                key_expr = self._transform_expr(key_part.strip())
-                val_expr = self._transform_expr(value_part.strip())
-                return f"{dict_expr}[{key_expr}] = {val_expr}", False
-
-        if lowered.startswith("keys "):
-            dict_expr = self._transform_expr(stripped[5:].strip())
-            return f"list({dict_expr}.keys())", False
-
-        if lowered.startswith("values "):
-            dict_expr = self._transform_expr(stripped[7:].strip())
-            return f"list({dict_expr}.values())", False
-
-        if lowered.startswith("items "):
-            dict_expr = self._transform_expr(stripped[6:].strip())
-            return f"list({dict_expr}.items())", False
-
-        if lowered.startswith("pop ") and " " in stripped:
-            body = stripped[4:]
-            if " " in body:
-                dict_name, key_part = body.split(" ", 1)
-                dict_expr = self._transform_expr(dict_name.strip())
-                key_expr = self._transform_expr(key_part.strip())
-                return f"{dict_expr}.pop({key_expr}, None)", False
-
-        if lowered.startswith("pop "):
-            list_name = stripped[4:].strip()
-            return f"{list_name}.pop()", False
-
-        if lowered.startswith("unpack ") and " into " in lowered:
-            value_part, target_part = stripped[7:].split(" into ", 1)
-            value_expr = self._transform_expr(value_part.strip())
-            targets = target_part.strip()
-            return f"{targets} = {value_expr}", False
-
-        if lowered in {"break", "continue", "pass"}:
-            return lowered, False
-
-        # Explicit list declaration, e.g., "list nums is [1,2,3]" or "list nums"
-        if lowered.startswith("list "):
-            body = stripped[5:].strip()
-            if " is " in body:
-                name_part, expr_part = body.split(" is ", 1)
-                expr = self._transform_expr(expr_part.strip())
-            else:
-                name_part, expr = body, "[]"
-            var = name_part.strip()
-            self._validate_name(var, line)
-            self._validate_expr(expr, line)
-            return f"{var} = {expr}", False
-
-        # Explicit dict declaration, e.g., "dict user is {name:"Alex"}" or "dict user"
-        if lowered.startswith("dict "):
-            body = stripped[5:].strip()
-            if " is " in body:
-                name_part, expr_part = body.split(" is ", 1)
-                expr = self._transform_expr(expr_part.strip())
-            else:
-                name_part, expr = body, "{}"
-            var = name_part.strip()
-            self._validate_name(var, line)
-            self._validate_expr(expr, line)
-            return f"{var} = {expr}", False
-
-        # Assignment using "is"
-        if " is " in lowered:
-            var_name, expr_part = stripped.split(" is ", 1)
-            var = var_name.strip()
-            self._validate_name(var, line)
+        dict_name, sep, key = stripped[4:].partition(" ")
+        if not sep:
+            return None
+        dict_expr = self._transform_expr(dict_name.strip())
+        raw_key = key.strip()
+        if raw_key.isidentifier():
+            key_expr = repr(raw_key)
+        else:
+            key_expr = self._transform_expr(raw_key)
+        return f"{dict_expr}.get({key_expr})", False
+
+    def _tl_set(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        idx = stripped.find(" to ", 4)
+        if idx == -1:
+            return None
+        before_to, value_part = stripped[4:idx], stripped[idx + 4:]
+        dict_name, sep, key_part = before_to.partition(" ")
+        if not sep:
+            return None
+        dict_expr = self._transform_expr(dict_name.strip())
+        key_expr = self._transform_expr(key_part.strip())
+        val_expr = self._transform_expr(value_part.strip())
+        return f"{dict_expr}[{key_expr}] = {val_expr}", False
+
+    def _tl_keys(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        dict_expr = self._transform_expr(stripped[5:].strip())
+        return f"list({dict_expr}.keys())", False
+
+    def _tl_values(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        dict_expr = self._transform_expr(stripped[7:].strip())
+        return f"list({dict_expr}.values())", False
+
+    def _tl_items(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        dict_expr = self._transform_expr(stripped[6:].strip())
+        return f"list({dict_expr}.items())", False
+
+    def _tl_pop(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        dict_name, sep, key_part = stripped[4:].partition(" ")
+        if sep:
+            dict_expr = self._transform_expr(dict_name.strip())
+            key_expr = self._transform_expr(key_part.strip())
+            return f"{dict_expr}.pop({key_expr}, None)", False
+
+        list_name = stripped[4:].strip()
+        return f"{list_name}.pop()", False
+
+    def _tl_unpack(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        idx = stripped.find(" into ", 7)
+        if idx == -1:
+            return None
+        value_part, target_part = stripped[7:idx], stripped[idx + 6:]
+        value_expr = self._transform_expr(value_part.strip())
+        targets = target_part.strip()
+        return f"{targets} = {value_expr}", False
+
+    # Explicit list declaration, e.g., "list nums is [1,2,3]" or "list nums"
+    def _tl_list(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        return self._declare(stripped, "[]")
+
+    # Explicit dict declaration, e.g., "dict user is {name:"Alex"}" or "dict user"
+    def _tl_dict(self, stripped: str, head: str) -> Optional[Tuple[str, bool]]:
+        return self._declare(stripped, "{}")
+
+    def _declare(self, stripped: str, empty: str) -> Tuple[str, bool]:
+        body = stripped[5:].strip()
+        name_part, sep, expr_part = body.partition(" is ")
+        if sep:
             expr = self._transform_expr(expr_part.strip())
-            self._validate_expr(expr, line)
-            return f"{var} = {expr}", False
-
-        # Fall back: expression-only line
-        expr = self._transform_expr(stripped)
-        self._validate_expr(expr, line)
-        return expr, False
-
-        raise TaleSyntaxError(f"I could not understand: {line.strip()}")
+        else:
+            expr = empty
+        var = name_part.strip()
+        self._validate_name(var, stripped)
+        self._validate_expr(expr, stripped)
+        return f"{var} = {expr}", False
+
+    _LINE_HANDLERS = {
+        "if": _tl_if,
+        "while": _tl_while,
+        "function": _tl_function,
+        "generator": _tl_generator,
+        "class": _tl_class,
+        "with": _tl_with,
+        "for": _tl_for,
+        "repeat": _tl_repeat,
+        "say": _tl_say,
+        "ask": _tl_ask,
+        "return": _tl_return,
+        "yield": _tl_yield,
+        "raise": _tl_raise,
+        "import": _tl_passthrough,
+        "from": _tl_passthrough,
+        "global": _tl_passthrough,
+        "open": _tl_open,
+        "write": _tl_write,
+        "append": _tl_append,
+        "read": _tl_read,
+        "close": _tl_close,
+        "add": _tl_add,
+        "extend": _tl_extend,
+        "insert": _tl_insert,
+        "remove": _tl_remove,
+        "clear": _tl_clear,
+        "sort": _tl_sort,
+        "reverse": _tl_reverse,
+        "copy": _tl_copy,
+        "get": _tl_get,
+        "set": _tl_set,
+        "keys": _tl_keys,
+        "values": _tl_values,
+        "items": _tl_items,
+        "pop": _tl_pop,
+        "unpack": _tl_unpack,
+        "list": _tl_list,
+        "dict": _tl_dict,
+    }
 
     def _parse_fn_header(self, header: str, line: str) -> Tuple[str, str]:
         parts = header.split()
@@ -490,55 +748,60 @@ class TaleInterpreter:
 
     def _split_args(self, text: str) -> List[str]:
         # Split by commas respecting simple quotes
+        if "," not in text:
+            return [text] if text else []
+        if '"' not in text and "'" not in text:
+            return _split_plain(text, ",")
+
         parts: List[str] = []
-        current = []
+        start = 0
         in_str = False
         quote_char = ''
-        for char in text:
-            if char in {'"', "'"}:
-                if in_str and char == quote_char:
+        for i, char in enumerate(text):
+            if in_str:
+                if char == quote_char:
                     in_str = False
-                elif not in_str:
-                    in_str = True
-                    quote_char = char
-            if char == "," and not in_str:
-                parts.append("".join(current))
-                current = []
-            else:
-                current.append(char)
-        if current:
-            parts.append("".join(current))
+            elif char == '"' or char == "'":
+                in_str = True
+                quote_char = char
+            elif char == ",":
+                parts.append(text[start:i])
+                start = i + 1
+        if start < len(text):
+            parts.append(text[start:])
         return parts
 
     def _split_concat_args(self, text: str) -> List[str]:
         """Split by top-level plus signs while respecting quotes/brackets."""
+        if "+" not in text:
+            return [text] if text else []
+        if not _RE_QUOTE_OR_BRACKET.search(text):
+            return _split_plain(text, "+")
+
         parts: List[str] = []
-        current: List[str] = []
+        start = 0
         in_str = False
         quote_char = ''
         depth = 0
 
-        for char in text:
-            if char in {'"', "'"}:
-                if in_str and char == quote_char:
+        for i, char in enumerate(text):
+            if in_str:
+                if char == quote_char:
                     in_str = False
-                elif not in_str:
-                    in_str = True
-                    quote_char = char
-            elif not in_str:
-                if char in "([{":
-                    depth += 1
-                elif char in ")]}":
-                    depth = max(0, depth - 1)
-
-            if char == "+" and not in_str and depth == 0:
-                parts.append("".join(current))
-                current = []
-            else:
-                current.append(char)
-
-        if current:
-            parts.append("".join(current))
+            elif char == '"' or char == "'":
+                in_str = True
+                quote_char = char
+            elif char == "(" or char == "[" or char == "{":
+                depth += 1
+            elif char == ")" or char == "]" or char == "}":
+                if depth:
+                    depth -= 1
+            elif char == "+" and not depth:
+                parts.append(text[start:i])
+                start = i + 1
+
+        if start < len(text):
+            parts.append(text[start:])
         return parts
 
     def _looks_like_string(self, text: str) -> bool:
@@ -563,307 +826,359 @@ class TaleInterpreter:
         return first.strip(), rest.strip()
 
     def _normalize_dict(self, expr: str) -> str:
-        # Convert name: to "name": inside dict literals
-        pattern = r"(?<![\"'])\b(?P<key>[A-Za-z_][\w]*)\s*:"
-        return re.sub(pattern, r'"\g<key>":', expr)
+        # Convert name: to "name": inside dict literals, leaving string contents alone.
+        if ":" not in expr:
+            return expr
+        out: List[str] = []
+        done = 0
+        i = 0
+        n = len(expr)
+        while i < n:
+            ch = expr[i]
+            if ch == '"' or ch == "'":
+                i += 1
+                while i < n and expr[i] != ch:
+                    i += 2 if expr[i] == "\\" else 1
+                i += 1
+            elif ch.isalnum() or ch == "_":
+                j = i + 1
+                while j < n and (expr[j].isalnum() or expr[j] == "_"):
+                    j += 1
+                # A word glued to a closing quote is not a key, e.g. "a"b: 1.
+                if ch in _KEY_START and (i == 0 or expr[i - 1] not in "\"'"):
+                    k = j
+                    while k < n and expr[k].isspace():
+                        k += 1
+                    if k < n and expr[k] == ":":
+                        out.append(expr[done:i])
+                        out.append(f'"{expr[i:j]}":')
+                        done = j = k + 1
+                i = j
+            else:
+                i += 1
+        if not out:
+            return expr
+        out.append(expr[done:])
+        return "".join(out)
 
     def _transform_expr(self, expr: str) -> str:
+        # Bare names and integers are the most common operands; at most they spell a
+        # constant. Keeping them out of the cache leaves room for real expressions.
+        if expr.isascii() and (expr.isidentifier() or expr.isdigit()):
+            return _BARE_CONSTANTS.get(expr.lower(), expr)
+        # Helpers recurse into their operands, so the same fragments come up repeatedly.
+        cached = self._xform_cache.get(expr)
+        if cached is not None:
+            return cached
+        result = self._transform_expr_uncached(expr)
+        if len(self._xform_cache) >= _XFORM_CACHE_LIMIT:
+            self._xform_cache.clear()
+        self._xform_cache[expr] = result
+        return result
+
+    def _transform_expr_uncached(self, expr: str) -> str:
         expr = expr.strip()
 
         # If it's a plain string literal, return as-is so we don't mis-handle colons inside.
         if self._looks_like_string(expr):
             return expr
 
-        if expr.startswith("type of "):
-            return f"type({self._transform_expr(expr[8:].strip())})"
-        if expr.startswith("id of "):
-            return f"id({self._transform_expr(expr[6:].strip())})"
-        if expr.startswith('text r"') or expr.startswith("text r'"):
-            return expr[5:].strip()
-
-        # String helpers
-        unary_str = {
-            "upper ": ".upper()",
-            "lower ": ".lower()",
-            "title ": ".title()",
-            "strip ": ".strip()",
-            "isalpha ": ".isalpha()",
-            "isdigit ": ".isdigit()",
-            "isalnum ": ".isalnum()",
-        }
-        for prefix, suffix in unary_str.items():
-            if expr.startswith(prefix):
-                tail = expr[len(prefix):].strip()
-                if tail.startswith("of "):
-                    tail = tail[3:].strip()
-                base = self._transform_expr(tail)
-                return f"({base}){suffix}"
-
-        if expr.startswith("replace "):
-            match = re.match(r'replace\s+(.+?)\s+"([^"]*)"\s+"([^"]*)"', expr)
-            if match:
-                base = self._transform_expr(match.group(1).strip())
-                old = match.group(2)
-                new = match.group(3)
-                return f"({base}).replace(\"{old}\", \"{new}\")"
-
-        if expr.startswith("split "):
-            match = re.match(r'split\s+(.+?)\s+(.+)$', expr)
-            if match:
-                base = self._transform_expr(match.group(1).strip())
-                sep = self._transform_expr(match.group(2).strip())
-                return f"({base}).split({sep})"
-
-        if expr.startswith("join "):
-            match = re.match(r'join\s+(.+?)\s+(.+)$', expr)
-            if match:
-                glue = self._transform_expr(match.group(1).strip())
-                target = self._transform_expr(match.group(2).strip())
-                return f"({glue}).join({target})"
-
-        if expr.startswith("find "):
-            match = re.match(r'find\s+(.+?)\s+(.+)$', expr)
-            if match:
-                base = self._transform_expr(match.group(1).strip())
-                sub = self._transform_expr(match.group(2).strip())
-                return f"({base}).find({sub})"
-
-        if expr.startswith("count "):
-            # Allow `count > 0` style comparisons by skipping the helper when the next token is an operator.
-            if not re.match(r"count\s*[><=]", expr):
-                match = re.match(r'count\s+(.+?)\s+(.+)$', expr)
-                if match:
-                    base = self._transform_expr(match.group(1).strip())
-                    sub = self._transform_expr(match.group(2).strip())
-                    return f"({base}).count({sub})"
-
-        if expr.startswith("starts "):
-            match = re.match(r'starts\s+(.+?)\s+(.+)$', expr)
-            if match:
-                base = self._transform_expr(match.group(1).strip())
-                sub = self._transform_expr(match.group(2).strip())
-                return f"({base}).startswith({sub})"
-
-        if expr.startswith("ends "):
-            match = re.match(r'ends\s+(.+?)\s+(.+)$', expr)
-            if match:
-                base = self._transform_expr(match.group(1).strip())
-                sub = self._transform_expr(match.group(2).strip())
-                return f"({base}).endswith({sub})"
-
-        # Map/filter helpers
-        if expr.startswith("map "):
-            _, rest = expr.split(" ", 1)
-            fn_part, seq_part = self._split_first(rest)
-            return f"map({self._transform_expr(fn_part)}, {self._transform_expr(seq_part)})"
-
-        if expr.startswith("filter "):
-            _, rest = expr.split(" ", 1)
-            fn_part, seq_part = self._split_first(rest)
-            return f"filter({self._transform_expr(fn_part)}, {self._transform_expr(seq_part)})"
-
-        if expr.startswith("enumerate "):
-            return f"enumerate({self._transform_expr(expr[10:].strip())})"
-
-        if expr.startswith("zip "):
-            parts = [self._transform_expr(p.strip()) for p in self._split_args(expr[4:])]
-            return f"zip({', '.join(parts)})"
-
-        if expr.startswith("next "):
-            return f"next({self._transform_expr(expr[5:].strip())})"
-
-        # Explicit call helper: "call foo" or "call foo 1 2"
-        if expr.startswith("call "):
-            body = expr[5:].strip()
-            if not body:
-                raise TaleSyntaxError("I could not understand: call")
-            # If user already wrote parentheses, just transform as a normal expr.
-            if "(" in body:
-                return self._transform_expr(body)
-            try:
-                parts = shlex.split(body, posix=False)
-            except ValueError:
-                parts = body.split()
-            fn_name, *arg_parts = parts
-            if not re.match(r"^[A-Za-z_][\w]*$", fn_name):
-                raise TaleSyntaxError(f"I could not understand: {expr}")
-            if not arg_parts:
-                return f"{fn_name}()"
-            arg_exprs = [self._transform_expr(p) for p in arg_parts]
-            return f"{fn_name}({', '.join(arg_exprs)})"
-
-        # Dictionary get helper inside expressions: "get user name" -> user.get("name")
-        if expr.startswith("get "):
-            body = expr[4:].strip()
-            if " " in body:
-                dict_name, key = body.split(" ", 1)
-                dict_expr = self._transform_expr(dict_name.strip())
-                raw_key = key.strip()
-                if re.match(r"^[A-Za-z_][\w]*$", raw_key):
-                    key_expr = repr(raw_key)
-                else:
-                    key_expr = self._transform_expr(raw_key)
-                return f"({dict_expr}).get({key_expr})"
-
-        if expr.startswith("len "):
-            return f"len({self._transform_expr(expr[4:].strip())})"
-
-        if expr.startswith("sum "):
-            return f"sum({self._transform_expr(expr[4:].strip())})"
-
-        if expr.startswith("min "):
-            return f"min({self._transform_expr(expr[4:].strip())})"
-
-        if expr.startswith("max "):
-            return f"max({self._transform_expr(expr[4:].strip())})"
-
-        if expr.startswith("sorted "):
-            return f"sorted({self._transform_expr(expr[7:].strip())})"
-
-        if expr.startswith("any "):
-            return f"any({self._transform_expr(expr[4:].strip())})"
-
-        if expr.startswith("all "):
-            return f"all({self._transform_expr(expr[4:].strip())})"
-
-        # Set operations
-        if expr.startswith("union "):
-            a, b = self._split_first(expr[6:])
-            return f"({self._transform_expr(a)}) | ({self._transform_expr(b)})"
-
-        if expr.startswith("intersection "):
-            a, b = self._split_first(expr[13:])
-            return f"({self._transform_expr(a)}) & ({self._transform_expr(b)})"
-
-        if expr.startswith("difference "):
-            a, b = self._split_first(expr[11:])
-            return f"({self._transform_expr(a)}) - ({self._transform_expr(b)})"
-
-        if expr.startswith("subset "):
-            a, b = self._split_first(expr[7:])
-            return f"({self._transform_expr(a)}).issubset({self._transform_expr(b)})"
-
-        if expr.startswith("copy "):
-            return f"({self._transform_expr(expr[5:].strip())}).copy()"
-
-        # Dictionary helpers
-        if expr.startswith("dict "):
-            # allow "dict name is { ... }" handled earlier; here treat as literal
-            return self._normalize_dict(expr[5:])
-
-        # JSON / CSV helpers
-        if expr.startswith("json read "):
-            path_expr = self._transform_expr(expr[10:].strip())
-            return f"read_json({path_expr})"
-        if expr.startswith("json write ") and " to " in expr:
-            body = expr[11:]
-            data_part, path_part = body.split(" to ", 1)
-            data_expr = self._transform_expr(data_part.strip())
-            path_expr = self._transform_expr(path_part.strip())
-            return f"write_json({data_expr}, {path_expr})"
-        if expr.startswith("csv read "):
-            path_expr = self._transform_expr(expr[9:].strip())
-            return f"read_csv({path_expr})"
-        if expr.startswith("csv write ") and " to " in expr:
-            body = expr[10:]
-            rows_part, path_part = body.split(" to ", 1)
-            rows_expr = self._transform_expr(rows_part.strip())
-            path_expr = self._transform_expr(path_part.strip())
-            return f"write_csv({rows_expr}, {path_expr})"
-
-        if expr.startswith("read "):
-            return f"({self._transform_expr(expr[5:].strip())}).read()"
-
-        # Lambda arrow syntax
-        if expr.startswith("lambda ") and "->" in expr:
-            params, body = expr[7:].split("->", 1)
-            return f"lambda {params.strip()}: {self._transform_expr(body.strip())}"
+        # Helper forms are picked by their first word; a handler returns None when the
+        # expression does not fit, leaving it to the shorthand and keyword handling below.
+        head, sep, rest = expr.partition(" ")
+        if sep:
+            if head in _UNARY_STR_SUFFIX or head in _WRAPPED_BUILTINS:
+                return self._transform_prefixed(head, rest)
+            handler = self._EXPR_HANDLERS.get(head)
+            if handler is not None:
+                transformed = handler(self, expr)
+                if transformed is not None:
+                    return transformed
 
         # Space-separated call shorthand: "add 5 7" -> "add(5, 7)" when safe.
-        if re.match(r"^[A-Za-z_][\w]*\s", expr) and not any(op in expr for op in "+-*/%<>=:()[]{}.,"):
-            try:
-                parts = shlex.split(expr, posix=False)  # keep quotes intact for string args
-            except ValueError:
-                parts = expr.split()
+        if _SHORTHAND_FORBIDDEN.isdisjoint(expr):
+            parts = _split_words(expr)  # keep quotes intact for string args
             if len(parts) > 1:
                 fn_name, arg_parts = parts[0], parts[1:]
-                if re.match(r"^[A-Za-z_][\w]*$", fn_name):
+                if _is_name(fn_name):
                     arg_exprs = [self._transform_expr(p) for p in arg_parts]
                     return f"{fn_name}({', '.join(arg_exprs)})"
 
         # Comprehension and slices already look like Python; normalize keywords
         expr = self._normalize_dict(expr)
-        expr = re.sub(r"\btrue\b", "True", expr, flags=re.IGNORECASE)
-        expr = re.sub(r"\bfalse\b", "False", expr, flags=re.IGNORECASE)
-        expr = re.sub(r"\bnothing\b", "None", expr, flags=re.IGNORECASE)
-        expr = re.sub(r"\bnone\b", "None", expr, flags=re.IGNORECASE)
-        expr = re.sub(r"\bis not same as\b", " != ", expr, flags=re.IGNORECASE)
-        expr = re.sub(r"\bis same as\b", " == ", expr, flags=re.IGNORECASE)
+        # true/false/nothing/none, is (not) same as, number/text/decimal conversions
+        return _RE_KEYWORDS.sub(_keyword_rewrite, expr)
+
+    def _transform_prefixed(self, head: str, rest: str) -> str:
+        # Stacked prefixes such as "upper of lower of name" are peeled in one loop;
+        # the core is transformed once and wrapped from the inside out.
+        wrappers: List[str] = []
+        while True:
+            suffix = _UNARY_STR_SUFFIX.get(head)
+            if suffix is not None:
+                rest = rest.strip()
+                if rest.startswith("of "):
+                    rest = rest[3:]
+                wrappers.append(suffix)
+            else:
+                wrappers.append(head)
+            expr = rest.strip()
+            head, sep, rest = expr.partition(" ")
+            if not sep or (head not in _UNARY_STR_SUFFIX and head not in _WRAPPED_BUILTINS):
+                break
+        result = self._transform_expr(expr)
+        for wrapper in reversed(wrappers):
+            # Method suffixes start with "."; anything else is a builtin name.
+            result = f"({result}){wrapper}" if wrapper[0] == "." else f"{wrapper}({result})"
+        return result
+
+    def _expr_type(self, expr: str) -> Optional[str]:
+        if expr.startswith("type of "):
+            return f"type({self._transform_expr(expr[8:].strip())})"
+        return None
+
+    def _expr_id(self, expr: str) -> Optional[str]:
+        if expr.startswith("id of "):
+            return f"id({self._transform_expr(expr[6:].strip())})"
+        return None
+
+    def _expr_text(self, expr: str) -> Optional[str]:
+        if expr.startswith('text r"') or expr.startswith("text r'"):
+            return expr[5:].strip()
+        return None
 
-        # number/text/decimal conversions
-        expr = re.sub(r"\bnumber\(", "int(", expr)
-        expr = re.sub(r"\btext\(", "str(", expr)
-        expr = re.sub(r"\bdecimal\(", "float(", expr)
+    # String helpers
+    def _expr_replace(self, expr: str) -> Optional[str]:
+        match = _RE_REPLACE.match(expr)
+        if match:
+            base = self._transform_expr(match.group(1).strip())
+            old = match.group(2)
+            new = match.group(3)
+            return f"({base}).replace(\"{old}\", \"{new}\")"
+        return None
+
+    def _expr_str_method(self, expr: str) -> Optional[str]:
+        # Allow `count > 0` style comparisons by skipping the helper when the next token is an operator.
+        if _RE_COUNT_OP.match(expr):
+            return None
+        match = _RE_STR_OP.match(expr)
+        if match:
+            base = self._transform_expr(match.group(2).strip())
+            arg = self._transform_expr(match.group(3).strip())
+            return f"({base}).{_STR_METHODS[match.group(1)]}({arg})"
+        return None
+
+    # Map/filter helpers
+    def _expr_map(self, expr: str) -> Optional[str]:
+        fn_part, seq_part = self._split_first(expr[4:])
+        return f"map({self._transform_expr(fn_part)}, {self._transform_expr(seq_part)})"
+
+    def _expr_filter(self, expr: str) -> Optional[str]:
+        fn_part, seq_part = self._split_first(expr[7:])
+        return f"filter({self._transform_expr(fn_part)}, {self._transform_expr(seq_part)})"
+
+    def _expr_zip(self, expr: str) -> Optional[str]:
+        parts = [self._transform_expr(p.strip()) for p in self._split_args(expr[4:])]
+        return f"zip({', '.join(parts)})"
+
+    # Explicit call helper: "call foo" or "call foo 1 2"
+    def _expr_call(self, expr: str) -> Optional[str]:
+        body = expr[5:].strip()
+        if not body:
+            raise TaleSyntaxError("I could not understand: call")
+        # If user already wrote parentheses, just transform as a normal expr.
+        if "(" in body:
+            return self._transform_expr(body)
+        parts = _split_words(body)
+        fn_name, *arg_parts = parts
+        if not _is_name(fn_name):
+            raise TaleSyntaxError(f"I could not understand: {expr}")
+        if not arg_parts:
+            return f"{fn_name}()"
+        arg_exprs = [self._transform_expr(p) for p in arg_parts]
+        return f"{fn_name}({', '.join(arg_exprs)})"
+
+    # Dictionary get helper inside expressions: "get user name" -> user.get("name")
+    def _expr_get(self, expr: str) -> Optional[str]:
+        dict_name, sep, key = expr[4:].strip().partition(" ")
+        if not sep:
+            return None
+        dict_expr = self._transform_expr(dict_name.strip())
+        raw_key = key.strip()
+        if raw_key.isidentifier():
+            key_expr = repr(raw_key)
+        else:
+            key_expr = self._transform_expr(raw_key)
+        return f"({dict_expr}).get({key_expr})"
+
+    # Set operations
+    def _expr_union(self, expr: str) -> Optional[str]:
+        a, b = self._split_first(expr[6:])
+        return f"({self._transform_expr(a)}) | ({self._transform_expr(b)})"
+
+    def _expr_intersection(self, expr: str) -> Optional[str]:
+        a, b = self._split_first(expr[13:])
+        return f"({self._transform_expr(a)}) & ({self._transform_expr(b)})"
+
+    def _expr_difference(self, expr: str) -> Optional[str]:
+        a, b = self._split_first(expr[11:])
+        return f"({self._transform_expr(a)}) - ({self._transform_expr(b)})"
+
+    def _expr_subset(self, expr: str) -> Optional[str]:
+        a, b = self._split_first(expr[7:])
+        return f"({self._transform_expr(a)}).issubset({self._transform_expr(b)})"
+
+    def _expr_copy(self, expr: str) -> Optional[str]:
+        return f"({self._transform_expr(expr[5:].strip())}).copy()"
+
+    # Dictionary helpers
+    def _expr_dict(self, expr: str) -> Optional[str]:
+        # allow "dict name is { ... }" handled earlier; here treat as literal
+        return self._normalize_dict(expr[5:])
+
+    # JSON / CSV helpers
+    # File helpers: "json read path", "csv stream path", "csv write rows to path".
+    def _expr_file(self, expr: str) -> Optional[str]:
+        fmt, _, rest = expr.partition(" ")
+        verb, sep, tail = rest.partition(" ")
+        handler = self._FILE_EXPR_HANDLERS.get((fmt, verb))
+        if handler is None or not sep:
+            return None
+        return handler(self, fmt, tail)
+
+    def _expr_read_file(self, fmt: str, tail: str) -> Optional[str]:
+        path_expr = self._transform_expr(tail.strip())
+        return f"read_{fmt}({path_expr})"
+
+    def _expr_stream_file(self, fmt: str, tail: str) -> Optional[str]:
+        path_expr = self._transform_expr(tail.strip())
+        return f"stream_{fmt}({path_expr})"
+
+    def _expr_write_file(self, fmt: str, tail: str) -> Optional[str]:
+        idx = tail.find(" to ")
+        if idx == -1:
+            return None
+        data_expr = self._transform_expr(tail[:idx].strip())
+        path_expr = self._transform_expr(tail[idx + 4:].strip())
+        return f"write_{fmt}({data_expr}, {path_expr})"
+
+    def _expr_read(self, expr: str) -> Optional[str]:
+        return f"({self._transform_expr(expr[5:].strip())}).read()"
+
+    # Lambda arrow syntax
+    def _expr_lambda(self, expr: str) -> Optional[str]:
+        params, sep, body = expr[7:].partition("->")
+        if not sep:
+            return None
+        return f"lambda {params.strip()}: {self._transform_expr(body.strip())}"
+
+    _FILE_EXPR_HANDLERS = {
+        ("json", "read"): _expr_read_file,
+        ("json", "write"): _expr_write_file,
+        ("csv", "read"): _expr_read_file,
+        ("csv", "stream"): _expr_stream_file,
+        ("csv", "write"): _expr_write_file,
+    }
 
-        return expr
+    _EXPR_HANDLERS = {
+        "type": _expr_type,
+        "id": _expr_id,
+        "text": _expr_text,
+        "replace": _expr_replace,
+        "split": _expr_str_method,
+        "join": _expr_str_method,
+        "find": _expr_str_method,
+        "count": _expr_str_method,
+        "starts": _expr_str_method,
+        "ends": _expr_str_method,
+        "map": _expr_map,
+        "filter": _expr_filter,
+        "zip": _expr_zip,
+        "call": _expr_call,
+        "get": _expr_get,
+        "union": _expr_union,
+        "intersection": _expr_intersection,
+        "difference": _expr_difference,
+        "subset": _expr_subset,
+        "copy": _expr_copy,
+        "dict": _expr_dict,
+        "json": _expr_file,
+        "csv": _expr_file,
+        "read": _expr_read,
+        "lambda": _expr_lambda,
+    }
 
     def _validate_name(self, name: str, line: str) -> None:
-        if not name or not re.match(r"^[A-Za-z_][\w]*$", name):
+        if not _is_name(name):
             raise TaleSyntaxError(f"I could not understand: {line.strip()}")
 
     def _validate_expr(self, expr: str, line: str) -> None:
-        try:
-            tree = ast.parse(expr, mode="eval")
-        except SyntaxError:
+        if not _is_allowed_expr(expr):
             raise TaleSyntaxError(f"I could not understand: {line.strip()}")
 
-        allowed = (
-            ast.Expression,
-            ast.BinOp,
-            ast.UnaryOp,
-            ast.BoolOp,
-            ast.Compare,
-            ast.Call,
-            ast.Name,
-            ast.Constant,
-            ast.Load,
-            ast.Add,
-            ast.Sub,
-            ast.Mult,
-            ast.Div,
-            ast.Mod,
-            ast.FloorDiv,
-            ast.Pow,
-            ast.And,
-            ast.Or,
-            ast.Not,
-            ast.USub,
-            ast.UAdd,
-            ast.Eq,
-            ast.NotEq,
-            ast.Lt,
-            ast.LtE,
-            ast.Gt,
-            ast.GtE,
-            ast.List,
-            ast.Tuple,
-            ast.Dict,
-            ast.Set,
-            ast.ListComp,
-            ast.DictComp,
-            ast.SetComp,
-            ast.GeneratorExp,
-            ast.comprehension,
-            ast.IfExp,
-            ast.Subscript,
-            ast.Slice,
-            ast.Attribute,
-            ast.Lambda,
-        )
 
-        for node in ast.walk(tree):
-            if not isinstance(node, allowed):
-                raise TaleSyntaxError(f"I could not understand: {line.strip()}")
+# Node classes an expression may contain. ast.parse creates exactly these classes,
+# so a type lookup replaces isinstance against the whole list.
+_ALLOWED_AST_TYPES = frozenset(
+    {
+        ast.Expression,
+        ast.BinOp,
+        ast.UnaryOp,
+        ast.BoolOp,
+        ast.Compare,
+        ast.Call,
+        ast.Name,
+        ast.Constant,
+        ast.Load,
+        ast.Add,
+        ast.Sub,
+        ast.Mult,
+        ast.Div,
+        ast.Mod,
+        ast.FloorDiv,
+        ast.Pow,
+        ast.And,
+        ast.Or,
+        ast.Not,
+        ast.USub,
+        ast.UAdd,
+        ast.Eq,
+        ast.NotEq,
+        ast.Lt,
+        ast.LtE,
+        ast.Gt,
+        ast.GtE,
+        ast.List,
+        ast.Tuple,
+        ast.Dict,
+        ast.Set,
+        ast.ListComp,
+        ast.DictComp,
+        ast.SetComp,
+        ast.GeneratorExp,
+        ast.comprehension,
+        ast.IfExp,
+        ast.Subscript,
+        ast.Slice,
+        ast.Attribute,
+        ast.Lambda,
+    }
+)
+
+
+@functools.lru_cache(maxsize=4096)
+def _is_allowed_expr(expr: str) -> bool:
+    # Programs repeat the same conditions and bounds; keyed by expression text only
+    # so the verdict is shared across lines and interpreters.
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError:
+        return False
+
+    for node in ast.walk(tree):
+        if type(node) not in _ALLOWED_AST_TYPES:
+            return False
+    return True
 
 
 def _open_file(path: str, mode: str = "r"):
@@ -871,7 +1186,14 @@ def _open_file(path: str, mode: str = "r"):
 
 
 def _add_to(target, value):  # noqa: ANN001
-    """Append when possible; otherwise, use additive update."""
+    """Append when possible, add to sets; otherwise, use additive update."""
+    # Exact type checks first: lists are by far the usual target inside loops.
+    if type(target) is list:
+        target.append(value)
+        return target
+    if type(target) is set:
+        target.add(value)
+        return target
     if hasattr(target, "append"):
         target.append(value)
         return target
@@ -882,11 +1204,21 @@ def _add_to(target, value):  # noqa: ANN001
 
 
 def read_json(path: str):
-    with _open_file(path, "r") as fh:
-        return json.load(fh)
+    # json.loads decodes the whole byte string at once instead of going through
+    # a text wrapper chunk by chunk.
+    with open(path, "rb") as fh:
+        return json.loads(fh.read())
 
 
 def write_json(data, path: str):
+    # Compact dumps() encodes the whole document in C; dump() and indent= would
+    # go through the Python encoder piece by piece.
+    text = json.dumps(data, separators=(",", ":"))
+    with _open_file(path, "w") as fh:
+        fh.write(text)
+
+
+def write_json_pretty(data, path: str):
     with _open_file(path, "w") as fh:
         return json.dump(data, fh, indent=2)
 
@@ -896,6 +1228,12 @@ def read_csv(path: str):
         return [row for row in csv.reader(fh)]
 
 
+def stream_csv(path: str):
+    """Yield rows one at a time, for files too large to load with read_csv."""
+    with _open_file(path, "r") as fh:
+        yield from csv.reader(fh)
+
+
 def write_csv(rows, path: str):
     with _open_file(path, "w") as fh:
         writer = csv.writer(fh)
@@ -904,16 +1242,18 @@ def write_csv(rows, path: str):
         return rows
 
 
-def _build_safe_builtins():
-    allowed_imports = {"math", "random", "datetime", "json", "csv", "os", "sys"}
+_ALLOWED_IMPORTS = frozenset({"math", "random", "datetime", "json", "csv", "os", "sys"})
+
 
-    def safe_import(name, globals=None, locals=None, fromlist=None, level=0):  # noqa: ANN001
-        if name.split(".")[0] not in allowed_imports:
-            raise ImportError(f"Import not allowed: {name}")
-        return __import__(name, globals, locals, fromlist, level)
+def _safe_import(name, globals=None, locals=None, fromlist=None, level=0):  # noqa: ANN001
+    if name.partition(".")[0] not in _ALLOWED_IMPORTS:
+        raise ImportError(f"Import not allowed: {name}")
+    return __import__(name, globals, locals, fromlist, level)
 
+
+def _build_safe_builtins():
     safe = {
-        "__import__": safe_import,
+        "__import__": _safe_import,
         "abs": abs,
         "all": all,
         "any": any,
@@ -946,6 +1286,51 @@ def _build_safe_builtins():
     return safe
 
 
+class _ListBuffer:
+    """Collects program output as a list of chunks, joined once at the end."""
+
+    __slots__ = ("chunks",)
+    encoding = None  # matches io.StringIO
+
+    def __init__(self) -> None:
+        self.chunks: List[str] = []
+
+    def write(self, s: str) -> int:
+        self.chunks.append(s)
+        return len(s)
+
+    def flush(self) -> None:
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+    def getvalue(self) -> str:
+        return "".join(self.chunks)
+
+
+# Shared by every run; run_tale_code copies both before executing a program.
+_SAFE_BUILTINS = _build_safe_builtins()
+_SAFE_GLOBALS = {
+    "__name__": "__main__",
+    "math": math,
+    "random": random,
+    "datetime": datetime,
+    "json": json,
+    "csv": csv,
+    "os": os,
+    "sys": sys,
+    "read_json": read_json,
+    "write_json": write_json,
+    "write_json_pretty": write_json_pretty,
+    "read_csv": read_csv,
+    "stream_csv": stream_csv,
+    "write_csv": write_csv,
+    "_open_file": _open_file,
+    "_add_to": _add_to,
+}
+
+
 def run_tale_code(code: str, inputs: Optional[List[str]] = None) -> Dict[str, object]:
     interpreter = TaleInterpreter(code, inputs)
 
@@ -968,36 +1353,27 @@ def run_tale_code(code: str, inputs: Optional[List[str]] = None) -> Dict[str, ob
             "tale": code,
         }
 
-    output_buffer = io.StringIO()
+    output_buffer = _ListBuffer()
 
     def _safe_print(*args, **kwargs):  # noqa: ANN001
         print(*args, **kwargs, file=output_buffer)
 
-    safe_builtins = _build_safe_builtins()
-    safe_globals = {
-        "__builtins__": safe_builtins,
-        "__name__": "__main__",
-        "input_provider": interpreter.input_provider,
-        "print": _safe_print,
-        "math": math,
-        "random": random,
-        "datetime": datetime,
-        "json": json,
-        "csv": csv,
-        "os": os,
-        "sys": sys,
-        "read_json": read_json,
-        "write_json": write_json,
-        "read_csv": read_csv,
-        "write_csv": write_csv,
-        "_open_file": _open_file,
-        "_add_to": _add_to,
-    }
-    exec_env: dict = dict(safe_globals)
+    exec_env: dict = dict(_SAFE_GLOBALS)
+    # Programs can reach __builtins__ by name, so every run gets its own copy.
+    exec_env["__builtins__"] = dict(_SAFE_BUILTINS)
+    exec_env["__builtins__"]["print"] = _safe_print
+    exec_env["input_provider"] = interpreter.input_provider
+    exec_env["print"] = _safe_print
 
     try:
-        with redirect_stdout(output_buffer):
-            exec(python_code, exec_env, exec_env)
+        # Both print names write to the buffer. Only a program that reaches sys can
+        # write to stdout another way, and swapping sys.stdout affects every thread,
+        # so redirect just for those.
+        if "sys" in python_code:
+            with redirect_stdout(output_buffer):
+                exec(interpreter.compiled(), exec_env)
+        else:
+            exec(interpreter.compiled(), exec_env)
     except NameError as exc:
         return {
             "ok": False,
@@ -1034,12 +1410,12 @@ def run_tale_code(code: str, inputs: Optional[List[str]] = None) -> Dict[str, ob
 def analyze_tale_code(code: str) -> Dict[str, object]:
     interpreter = TaleInterpreter(code, [])
     try:
-        interpreter.to_python()
+        interpreter.validate_only()
         return {"ok": True, "diagnostics": []}
     except TaleSyntaxError as exc:
         line_no = None
         msg = str(exc)
-        match = re.match(r"Line (\d+):", msg)
+        match = _RE_LINE_NO.match(msg)
         if match:
             line_no = int(match.group(1))
         return {"ok": False, "diagnostics": [{"line": line_no, "message": msg}]}
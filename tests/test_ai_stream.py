@@ -0,0 +1,44 @@
+"""Streamed /ai_generate replies. Run with: python -m unittest discover tests"""
+
+import unittest
+
+import orjson
+
+import ai
+from app import app
+
+
+class CachedStreamTest(unittest.TestCase):
+    prompt = "say hello three times"
+
+    def setUp(self) -> None:
+        self.key = ai._prompt_key(ai._normalize_prompt(self.prompt))
+        ai._cache[self.key] = 'say "hello"'
+
+    def tearDown(self) -> None:
+        ai._cache.pop(self.key, None)
+
+    def test_cache_hit_yields_only_the_code(self) -> None:
+        events = ai.stream_tale_code(self.prompt)
+        self.assertEqual(list(events), [("code", 'say "hello"')])
+        events.close()
+
+    def test_cached_event_stream_completes(self) -> None:
+        client = app.test_client()
+        response = client.post(
+            "/ai_generate",
+            json={"prompt": self.prompt},
+            headers={"Accept": "text/event-stream"},
+        )
+        body = response.get_data()
+        response.close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        self.assertEqual(
+            body, b"data: " + orjson.dumps({"ok": True, "code": 'say "hello"'}) + b"\n\n"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()